@@ -2,14 +2,23 @@ import os
 import logging
 import subprocess
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 def handle_file_upload(file_path):
     def is_dicom_file(filepath):
         """Check if a file is a DICOM file by reading the magic number."""
         try:
-            with open(filepath, 'rb') as file:
-                file.seek(128)
-                magic_number = file.read(4)
+            # Read the 4 bytes after the 128-byte preamble straight from the descriptor
+            fd = os.open(filepath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            try:
+                if hasattr(os, 'pread'):
+                    magic_number = os.pread(fd, 4, 128)
+                else:  # os.pread is not available on Windows
+                    os.lseek(fd, 128, os.SEEK_SET)
+                    magic_number = os.read(fd, 4)
+            finally:
+                os.close(fd)
             return magic_number == b'DICM'
         except Exception as e:
             logging.error(f"Error reading file {filepath}: {str(e)}")
@@ -33,13 +42,16 @@ def handle_file_upload(file_path):
 
     def run_dcm2niix(input_file, output_dir, compression=True, reorient=True, verbose=False):
         """Run dcm2niix to convert DICOM to NIfTI format."""
-        compression_flag = '-z y' if compression else '-z n'
-        reorient_flag = '' if reorient else '-i n'
-        verbose_flag = '-v 1' if verbose else '-v 0'
+        # Pass an argument list so paths with spaces need no quoting and no shell is spawned
+        command = ['dcm2niix', '-z', 'y' if compression else 'n']
+        if not reorient:
+            command += ['-i', 'n']
+        command += ['-v', '1' if verbose else '0', '-o', output_dir, input_file]
 
-        command = f'dcm2niix {compression_flag} {reorient_flag} {verbose_flag} -o "{output_dir}" "{input_file}"'
+        # Discard output when not verbose so a full pipe can never stall the conversion
+        stdout = None if verbose else subprocess.DEVNULL
         try:
-            subprocess.run(command, check=True, shell=True)
+            subprocess.run(command, check=True, stdout=stdout)
             logging.info(f"Successfully converted {input_file} to NIfTI format.")
         except subprocess.CalledProcessError as e:
             logging.error(f"Failed to convert {input_file}. Error: {str(e)}")
@@ -47,9 +59,11 @@ def handle_file_upload(file_path):
 
     def get_first_nifti_file(directory):
         """Helper function to get the first NIfTI file in the directory."""
-        for file_name in os.listdir(directory):
-            if file_name.endswith(('.nii', '.nii.gz')):
-                return os.path.join(directory, file_name)
+        # scandir yields entries lazily, so the scan stops at the first match
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(('.nii', '.nii.gz')):
+                    return entry.path
         raise FileNotFoundError("No NIfTI file found in the output directory.")
 
     """Determine whether the file is a NIfTI or DICOM file and handle accordingly."""
@@ -62,19 +76,33 @@ def handle_file_upload(file_path):
         return file_path
 
 def clean_nifti_dir(dir_path = "path_to_save_converted_nifti_files"):
-    shutil.rmtree(dir_path)
+    """Delete the converted NIfTI directory, unlinking its files concurrently."""
+    try:
+        with os.scandir(dir_path) as entries:
+            file_paths = [entry.path for entry in entries if not entry.is_dir(follow_symlinks=False)]
+        with ThreadPoolExecutor(min(32, (os.cpu_count() or 1) * 4)) as executor:
+            list(executor.map(os.unlink, file_paths))
+        os.rmdir(dir_path)
+    except OSError:
+        # Subdirectories, read-only files or a missing directory: remove whatever rmtree can
+        shutil.rmtree(dir_path, ignore_errors=True)
 
-def extract_slice(nii_file):
-    """Extract a single slice from the NIfTI file."""
-    data = nii_file.get_fdata()
-    shape = data.shape
+def extract_slice(nii_file, max_size=None):
+    """Extract a single slice from the NIfTI file.
+
+    With max_size, only every n-th voxel in-plane is read, keeping the slice at least
+    max_size voxels along its longer side (enough for a thumbnail of that size).
+    """
+    # Slice the lazy dataobj proxy so only the requested plane is read from disk
+    shape = nii_file.shape
+    step = max(1, max(shape[:2]) // max_size) if max_size else 1
     if len(shape) == 2:  # 2D image
-        return data
+        return np.asanyarray(nii_file.dataobj[::step, ::step])
     elif len(shape) == 3:  # 3D image
-        return data[:, :, shape[2] // 2]
+        return np.asanyarray(nii_file.dataobj[::step, ::step, shape[2] // 2])
     elif len(shape) == 4 and shape[3] == 1:  # 3D image disguised as 4D
-        return data[:, :, shape[2] // 2, 0]
+        return np.asanyarray(nii_file.dataobj[::step, ::step, shape[2] // 2, 0])
     elif len(shape) == 4:  # 4D image (CINE)
-        return data[:, :, shape[2] // 2, 0]
+        return np.asanyarray(nii_file.dataobj[::step, ::step, shape[2] // 2, 0])
     else:
         raise ValueError(f"Invalid shape {shape} for image data")
@@ -1,19 +1,323 @@
 # filtering_modifications.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 from skimage import restoration
+from scipy.fft import dctn, idctn
 from scipy.ndimage import gaussian_filter, median_filter
 
-def apply_gaussian_filter(img_data, sigma=1):
-    """Apply Gaussian filter to the image."""
-    return gaussian_filter(img_data, sigma=sigma)
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, the scipy filters are used without it
+    njit = None
+
+try:
+    import cv2
+except ImportError:  # OpenCV is optional, skimage's non-local means is used without it
+    cv2 = None
+
+# Per-thread scratch memory for filter temporaries, kept and grown across calls
+_scratch = threading.local()
+# Larger temporaries are allocated per call instead: pooled worker threads live for the
+# whole session, and each would otherwise hold on to a buffer the size of its largest volume
+_SCRATCH_KEEP_MAX_BYTES = 64 * 1024 * 1024
+
+# Compare-and-swap network for the median of 9 values (the median ends up in slot 4)
+_MEDIAN9_NETWORK = (
+    (1, 2), (4, 5), (7, 8), (0, 1), (3, 4), (6, 7), (1, 2), (4, 5), (7, 8),
+    (0, 3), (5, 8), (4, 7), (3, 6), (1, 4), (2, 5), (4, 7), (4, 2), (6, 4), (4, 2),
+)
+
+if njit is not None:
+    @njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _median3x3_kernel(padded, out):
+        """3x3 median of a 2D image padded by one pixel, using a sorting network."""
+        height, width = out.shape
+        for row in prange(height):
+            buf = np.empty(9, dtype=padded.dtype)
+            for col in range(width):
+                for i in range(3):
+                    for j in range(3):
+                        buf[3 * i + j] = padded[row + i, col + j]
+                for a, b in _MEDIAN9_NETWORK:
+                    if buf[a] > buf[b]:
+                        buf[a], buf[b] = buf[b], buf[a]
+                out[row, col] = buf[4]
+
+    @njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _median2d_kernel(padded, size, out):
+        """size x size median of a 2D image padded by size // 2 pixels."""
+        height, width = out.shape
+        k = (size * size) // 2
+        for row in prange(height):
+            buf = np.empty(size * size, dtype=padded.dtype)
+            for col in range(width):
+                n = 0
+                for i in range(size):
+                    for j in range(size):
+                        buf[n] = padded[row + i, col + j]
+                        n += 1
+                out[row, col] = np.partition(buf, k)[k]
+
+    @njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _median3d_kernel(padded, size, out):
+        """size x size x size median of a 3D volume padded by size // 2 voxels."""
+        nx, ny, nz = out.shape
+        k = (size * size * size) // 2
+        for x in prange(nx):
+            buf = np.empty(size * size * size, dtype=padded.dtype)
+            for y in range(ny):
+                for z in range(nz):
+                    n = 0
+                    for i in range(size):
+                        for j in range(size):
+                            for m in range(size):
+                                buf[n] = padded[x + i, y + j, z + m]
+                                n += 1
+                    out[x, y, z] = np.partition(buf, k)[k]
+
+    @njit(inline='always')
+    def _reflect_index(j, n):
+        """Index j folded into [0, n) the way scipy's 'reflect' mode extends an axis."""
+        while j < 0 or j >= n:
+            if j < 0:
+                j = -j - 1
+            if j >= n:
+                j = 2 * n - j - 1
+        return j
+
+    @njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _convolve_axis1_kernel(src, dst, weights, radius):
+        """Symmetric 1D convolution along axis 1 of (outer, n, inner) arrays, inner is contiguous."""
+        outer, n, inner = src.shape
+        for line in prange(outer * n):
+            i = line // n
+            j = line - i * n
+            for k in range(inner):
+                dst[i, j, k] = weights[radius] * src[i, j, k]
+            for m in range(radius):
+                lo = _reflect_index(j - radius + m, n)
+                hi = _reflect_index(j + radius - m, n)
+                w = weights[m]
+                for k in range(inner):
+                    dst[i, j, k] += w * (src[i, lo, k] + src[i, hi, k])
+
+    @njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _convolve_last_axis_kernel(src, dst, weights, radius):
+        """Symmetric 1D convolution along the contiguous axis of (rows, n) arrays."""
+        rows, n = src.shape
+        for i in prange(rows):
+            # Copy the row with its reflected borders once, so the taps need no index folding
+            row = np.empty(n + 2 * radius, dtype=src.dtype)
+            for j in range(n + 2 * radius):
+                row[j] = src[i, _reflect_index(j - radius, n)]
+            for j in range(n):
+                acc = weights[radius] * row[j + radius]
+                for m in range(radius):
+                    acc += weights[m] * (row[j + m] + row[j + 2 * radius - m])
+                dst[i, j] = acc
+
+def _rent_scratch(shape, dtype):
+    """Return an uninitialised array view on this thread's scratch buffer.
+
+    The buffer only grows (up to _SCRATCH_KEEP_MAX_BYTES), so repeated filtering of same-sized
+    volumes never reallocates. The view is overwritten by the next rent on the same thread,
+    never return it to callers.
+    """
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if nbytes > _SCRATCH_KEEP_MAX_BYTES:
+        return np.empty(shape, dtype=dtype)  # Freed once the caller is done with it
+    buffer = getattr(_scratch, 'buffer', None)
+    if buffer is None or buffer.nbytes < nbytes:
+        buffer = _scratch.buffer = np.empty(nbytes, dtype=np.uint8)
+    return buffer[:nbytes].view(dtype).reshape(shape)
+
+def _pad_symmetric(img_data, pad):
+    """np.pad(img_data, pad, mode='symmetric') written into the scratch buffer."""
+    if pad == 0:
+        return img_data
+    if min(img_data.shape) < pad:
+        return np.pad(img_data, pad, mode='symmetric')  # Needs repeated reflections
+    padded = _rent_scratch(tuple(n + 2 * pad for n in img_data.shape), img_data.dtype)
+    padded[(slice(pad, -pad),) * img_data.ndim] = img_data
+    # Mirror one axis at a time over the full extent of the others, which fills the corners
+    for axis in range(img_data.ndim):
+        view = np.moveaxis(padded, axis, 0)
+        view[:pad] = view[pad:2 * pad][::-1]
+        view[-pad:] = view[-2 * pad:-pad][::-1]
+    return padded
+
+def _slab_axis(img_data):
+    """Axis to split into slabs: slices, or frames when a CINE has more frames than slices."""
+    if img_data.ndim < 3:
+        return None
+    return 2 + int(np.argmax(img_data.shape[2:]))
+
+def _filter_in_slabs(filter_func, img_data, halo, output=None, axis=2, **kwargs):
+    """Run filter_func over slabs along axis (slices by default) on a thread pool.
+
+    Each slab is filtered with halo extra slices on either side, so the stitched result
+    matches filtering the whole volume at once. The scipy filters release the GIL.
+    """
+    depth = img_data.shape[axis] if axis is not None and img_data.ndim > axis else 1
+    workers = min(os.cpu_count() or 1, depth)
+    if workers < 2:
+        return filter_func(img_data, output=output, **kwargs)
+
+    out = np.empty_like(img_data) if output is None else output
+    bounds = np.linspace(0, depth, workers + 1).astype(int)
+    lead = (slice(None),) * axis
+
+    def filter_slab(start, stop):
+        lo = max(0, start - halo)
+        hi = min(depth, stop + halo)
+        filtered = filter_func(img_data[lead + (slice(lo, hi),)], **kwargs)
+        out[lead + (slice(start, stop),)] = filtered[lead + (slice(start - lo, stop - lo),)]
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(filter_slab, bounds[:-1], bounds[1:]))
+    return out
+
+# Above this sigma the spectral filter beats the spatial kernel, whose cost grows with sigma
+_SPECTRAL_GAUSSIAN_MIN_SIGMA = 4
+_SPECTRAL_GAUSSIAN_MIN_SIGMA_NUMBA = 8  # The jitted kernel stays ahead for longer
+
+@lru_cache(maxsize=32)
+def _gaussian_weights(sigma, dtype):
+    """gaussian_filter's normalized 1D kernel, truncated at 4 sigma, and its radius."""
+    radius = int(4.0 * sigma + 0.5)
+    x = np.arange(-radius, radius + 1)
+    weights = np.exp(-0.5 * (x / sigma) ** 2)
+    return (weights / weights.sum()).astype(dtype), radius
+
+def _numba_gaussian_filter(img_data, sigma, output=None):
+    """gaussian_filter (reflect borders, 4 sigma truncation) as separable jitted passes."""
+    sigmas = np.broadcast_to(np.asarray(sigma, dtype=float), (img_data.ndim,))
+    # Work in C order: nibabel's Fortran-ordered volumes are transposed rather than copied
+    transposed = img_data.flags.f_contiguous and not img_data.flags.c_contiguous
+    src = img_data.T if transposed else np.ascontiguousarray(img_data)
+    if transposed:
+        sigmas = sigmas[::-1]
+
+    axes = [axis for axis in range(src.ndim) if sigmas[axis] > 0]
+    filtered = np.empty_like(src)
+    if not axes:
+        filtered[...] = src
+    scratch = _rent_scratch(src.shape, src.dtype) if len(axes) > 1 else None
+    for i, axis in enumerate(axes):
+        # Alternate between the buffers so that the last pass lands in filtered
+        dst = filtered if (len(axes) - 1 - i) % 2 == 0 else scratch
+        weights, radius = _gaussian_weights(float(sigmas[axis]), src.dtype)
+        outer = int(np.prod(src.shape[:axis]))
+        inner = int(np.prod(src.shape[axis + 1:]))
+        n = src.shape[axis]
+        if inner == 1:
+            _convolve_last_axis_kernel(src.reshape(outer, n), dst.reshape(outer, n), weights, radius)
+        else:
+            _convolve_axis1_kernel(src.reshape(outer, n, inner), dst.reshape(outer, n, inner), weights, radius)
+        src = dst
+
+    filtered = filtered.T if transposed else filtered
+    if output is None:
+        return filtered
+    output[...] = filtered
+    return output
+
+@lru_cache(maxsize=32)
+def _gaussian_dct_response(n, sigma, dtype):
+    """Gaussian frequency response at the n DCT-II frequencies of one axis."""
+    omega = np.pi * np.arange(n) / n
+    return np.exp(-0.5 * (sigma * omega) ** 2).astype(dtype)
+
+def _spectral_gaussian_filter(img_data, sigma, output=None):
+    """Gaussian filter applied as a product in the DCT-II domain.
+
+    The DCT-II implies the same half-sample mirror extension as gaussian_filter's 'reflect'
+    mode, so borders match it, and the cost does not depend on sigma.
+    """
+    sigmas = np.broadcast_to(np.asarray(sigma, dtype=float), (img_data.ndim,))
+    spectrum = dctn(img_data, type=2, workers=-1)
+    for axis, (axis_sigma, n) in enumerate(zip(sigmas, img_data.shape)):
+        if axis_sigma > 0:
+            shape = [1] * img_data.ndim
+            shape[axis] = n
+            spectrum *= _gaussian_dct_response(n, float(axis_sigma), spectrum.dtype).reshape(shape)
+    filtered = idctn(spectrum, type=2, workers=-1, overwrite_x=True)
+    if output is None:
+        return filtered.astype(img_data.dtype, copy=False)
+    output[...] = filtered
+    return output
+
+def apply_gaussian_filter(img_data, sigma=1, output=None):
+    """Apply Gaussian filter to the image.
+
+    sigma may be a per-axis sequence, a 0 skips that axis (e.g. (s, s, 0) for in-plane only).
+    output may be a preallocated array to write into instead of allocating a new one.
+    """
+    if img_data.dtype in (np.float32, np.float64):
+        spectral_min_sigma = _SPECTRAL_GAUSSIAN_MIN_SIGMA if njit is None else _SPECTRAL_GAUSSIAN_MIN_SIGMA_NUMBA
+        if np.max(sigma) >= spectral_min_sigma:
+            return _spectral_gaussian_filter(img_data, sigma, output=output)
+        if njit is not None:
+            return _numba_gaussian_filter(img_data, sigma, output=output)
+
+    # gaussian_filter truncates its kernel at 4 sigma
+    axis = _slab_axis(img_data)
+    axis_sigma = sigma[axis] if axis is not None and np.ndim(sigma) and len(sigma) > axis else sigma
+    halo = int(4.0 * float(np.max(axis_sigma)) + 0.5)
+    return _filter_in_slabs(gaussian_filter, img_data, halo, output=output, axis=axis, sigma=sigma)
 
 def apply_median_filter(img_data, size=3):
     """Apply Median filter to the image."""
-    return median_filter(img_data, size=size)
+    # The jitted kernels cover odd windows on 2D/3D data, anything else goes through scipy
+    if njit is None or size % 2 == 0 or img_data.ndim not in (2, 3):
+        return _filter_in_slabs(median_filter, img_data, size // 2, axis=_slab_axis(img_data), size=size)
+
+    # Symmetric padding matches scipy's default 'reflect' border handling
+    padded = _pad_symmetric(img_data, size // 2)
+    out = np.empty_like(img_data)
+    if img_data.ndim == 3:
+        _median3d_kernel(padded, size, out)
+    elif size == 3:
+        _median3x3_kernel(padded, out)
+    else:
+        _median2d_kernel(padded, size, out)
+    return out
 
 def apply_non_local_means(img_data, patch_size=5, patch_distance=6, h=0.1):
     """Apply Non-Local Means denoising to the image."""
-    return restoration.denoise_nl_means(
+    if cv2 is not None:
+        return _non_local_means_cv2(img_data, patch_size, patch_distance, h)
+    if img_data.ndim == 4:
+        # skimage only denoises 2D/3D, so CINE frames are denoised as separate volumes in parallel
+        return _filter_in_slabs(
+            _non_local_means_frames,
+            img_data,
+            0,
+            axis=3,
+            patch_size=patch_size,
+            patch_distance=patch_distance,
+            h=h
+        )
+    if img_data.ndim != 3:
+        return _non_local_means_skimage(img_data, patch_size=patch_size, patch_distance=patch_distance, h=h)
+
+    # A voxel's result only depends on patches within its search window
+    halo = patch_distance + patch_size // 2
+    return _filter_in_slabs(
+        _non_local_means_skimage,
+        img_data,
+        halo,
+        patch_size=patch_size,
+        patch_distance=patch_distance,
+        h=h
+    )
+
+def _non_local_means_skimage(img_data, output=None, patch_size=5, patch_distance=6, h=0.1):
+    """skimage's Non-Local Means, optionally written into output."""
+    denoised = restoration.denoise_nl_means(
         img_data,
         patch_size=patch_size,
         patch_distance=patch_distance,
@@ -21,3 +325,65 @@ def apply_non_local_means(img_data, patch_size=5, patch_distance=6, h=0.1):
         fast_mode=True,
         multichannel=False
     )
+    if output is None:
+        return denoised
+    output[...] = denoised
+    return output
+
+def _non_local_means_frames(img_data, output=None, **kwargs):
+    """_non_local_means_skimage on each 3D frame of a 4D image."""
+    out = np.empty(img_data.shape, dtype=np.result_type(img_data.dtype, np.float32)) if output is None else output
+    for t in range(img_data.shape[3]):
+        out[..., t] = _non_local_means_skimage(img_data[..., t], **kwargs)
+    return out
+
+def _non_local_means_cv2(img_data, patch_size, patch_distance, h):
+    """Slice-wise Non-Local Means with OpenCV on the image quantized to uint8 or uint16.
+
+    Integer data spanning at most 256 values is denoised exactly in uint8. Anything wider
+    (16-bit or float MRI) goes through OpenCV's 16-bit path, which needs the L1 patch norm,
+    so it keeps 65536 levels instead of being crushed to 256.
+    """
+    # Python floats, so the range of a wide int16 volume can't wrap
+    img_min = float(img_data.min())
+    img_max = float(img_data.max())
+    if img_max <= img_min:
+        return img_data.astype(np.float32)
+    if img_data.dtype.kind in 'iu' and img_max - img_min <= 255:
+        scale = 1.0  # Already 8-bit, shifting by the minimum loses nothing
+        quantized_dtype = np.uint8
+    else:
+        scale = 65535.0 / (img_max - img_min)
+        quantized_dtype = np.uint16
+
+    # OpenCV denoises 2D planes, so stack every plane beyond the first two axes contiguously
+    height, width = img_data.shape[:2]
+    img_shifted = np.subtract(img_data, img_min, dtype=np.float32)  # In float, not the input dtype
+    img_quantized = np.rint(img_shifted * scale, out=img_shifted).astype(quantized_dtype)
+    planes = np.ascontiguousarray(np.moveaxis(img_quantized.reshape(height, width, -1), 2, 0))
+
+    def denoise_plane(i):
+        # h is given in image intensity units
+        if quantized_dtype == np.uint8:
+            planes[i] = cv2.fastNlMeansDenoising(
+                planes[i],
+                None,
+                h=h * scale,
+                templateWindowSize=patch_size | 1,  # OpenCV needs an odd patch size
+                searchWindowSize=2 * patch_distance + 1
+            )
+        else:
+            planes[i] = cv2.fastNlMeansDenoising(
+                planes[i],
+                h=[h * scale],
+                templateWindowSize=patch_size | 1,
+                searchWindowSize=2 * patch_distance + 1,
+                normType=cv2.NORM_L1
+            )
+
+    # OpenCV releases the GIL, so the planes are denoised concurrently
+    with ThreadPoolExecutor(min(os.cpu_count() or 1, len(planes))) as executor:
+        list(executor.map(denoise_plane, range(len(planes))))
+
+    denoised = np.moveaxis(planes, 0, 2).reshape(img_data.shape)
+    return denoised.astype(np.float32) / np.float32(scale) + np.float32(img_min)
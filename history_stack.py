@@ -1,31 +1,69 @@
+from collections import deque
+import numpy as np
+
+try:
+    import blosc2
+except ImportError:  # blosc2 is optional, states are kept uncompressed without it
+    blosc2 = None
+
+
 class HistoryStack:
-    def __init__(self, max_size=20):
-        self.undo_stack = []
-        self.redo_stack = []
+    def __init__(self, max_size=20, memory_budget_mb=None):
+        self.undo_stack = deque(maxlen=max_size)  # Oldest state drops off once full
+        self.redo_stack = deque()
         self.max_size = max_size
+        self.memory_budget_mb = memory_budget_mb  # Also drop the oldest states past this total size
 
     def push(self, state):
-        if len(self.undo_stack) >= self.max_size:
-            self.undo_stack.pop(0)  # Remove the oldest state
-        self.undo_stack.append(state)
+        self.undo_stack.append(self._pack(state))
         self.redo_stack.clear()  # Clear redo stack on new action
+        self._enforce_budget()
 
     def undo(self):
         if self.can_undo():
-            state = self.undo_stack.pop()
-            self.redo_stack.append(state)
-            return state
+            entry = self.undo_stack.pop()
+            self.redo_stack.append(entry)
+            return self._unpack(entry)
         return None
 
     def redo(self):
         if self.can_redo():
-            state = self.redo_stack.pop()
-            self.undo_stack.append(state)
-            return state
+            entry = self.redo_stack.pop()
+            self.undo_stack.append(entry)
+            return self._unpack(entry)
         return None
 
     def can_undo(self):
         return len(self.undo_stack) > 0
 
     def can_redo(self):
-        return len(self.redo_stack) > 0
\ No newline at end of file
+        return len(self.redo_stack) > 0
+
+    def _pack(self, state):
+        """Return a (payload, is_compressed, is_transposed, nbytes) entry, compressing arrays with blosc2."""
+        if blosc2 is not None and isinstance(state, np.ndarray):
+            state = np.asarray(state)  # blosc2 rejects subclasses such as np.memmap
+            # nibabel volumes are Fortran-ordered, their transpose packs without a C-order copy
+            is_transposed = state.flags.f_contiguous and not state.flags.c_contiguous
+            payload = blosc2.pack_array2(
+                state.T if is_transposed else np.ascontiguousarray(state),
+                cparams={'codec': blosc2.Codec.ZSTD, 'clevel': 1}  # Level 1 packs ~5x faster for a similar ratio
+            )
+            return payload, True, is_transposed, len(payload)
+        return state, False, False, getattr(state, 'nbytes', 0)
+
+    def _unpack(self, entry):
+        payload, is_compressed, is_transposed, _ = entry
+        if not is_compressed:
+            return payload
+        state = blosc2.unpack_array2(payload)
+        return state.T if is_transposed else state
+
+    def _enforce_budget(self):
+        if self.memory_budget_mb is None:
+            return
+        budget = self.memory_budget_mb * 1024 * 1024
+        total = sum(entry[3] for entry in self.undo_stack)
+        # Always keep the newest state, even if it alone is over budget
+        while len(self.undo_stack) > 1 and total > budget:
+            total -= self.undo_stack.popleft()[3]
@@ -7,6 +7,11 @@ import nibabel as nib
 import numpy as np
 import os
 
+try:
+    import numexpr as ne
+except ImportError:  # numexpr is optional, plain NumPy in-place ops are used without it
+    ne = None
+
 class PreviewManager(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -14,6 +19,12 @@ class PreviewManager(QWidget):
         self.setup_ui()
         self.original_image = None
         self.modified_image = None
+        self._scratch_f32 = None  # Reused float32 buffer for normalization
+        self._scratch_i64 = None  # Reused integer buffers for the uint16 path
+        self._scratch_u16 = None
+        self._qimage_buffer = None  # Keeps the data behind the last QImage alive
+        self._orig_qpix = None  # Unscaled pixmaps, re-scaled on resize without touching NumPy
+        self._mod_qpix = None
 
     def setup_ui(self):
         self.layout = QVBoxLayout()
@@ -54,38 +65,76 @@ class PreviewManager(QWidget):
     def display_images(self):
         """Convert the slices to QPixmap and display them."""
         try:
-            # Convert NumPy arrays to QPixmap
-            original_pixmap = self.numpy_to_qpixmap(self.original_image)
-            modified_pixmap = self.numpy_to_qpixmap(self.modified_image)
+            # Convert NumPy arrays to QPixmap, decimated to about twice the label size
+            original_pixmap = self.numpy_to_qpixmap(self.downsample_for_label(self.original_image, self.original_label))
+            modified_pixmap = self.numpy_to_qpixmap(self.downsample_for_label(self.modified_image, self.modified_label))
 
             # Check if pixmaps are valid
             if original_pixmap.isNull() or modified_pixmap.isNull():
                 QMessageBox.critical(self, "Preview Error", "Failed to generate image previews.")
                 return
 
-            # Scale pixmaps to fit the labels while maintaining aspect ratio
-            scaled_original = original_pixmap.scaled(
-                self.original_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            scaled_modified = modified_pixmap.scaled(
-                self.modified_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-
-            self.original_label.setPixmap(scaled_original)
-            self.modified_label.setPixmap(scaled_modified)
+            self._orig_qpix = original_pixmap
+            self._mod_qpix = modified_pixmap
+            self.scale_pixmaps()
         except Exception as e:
             QMessageBox.critical(self, "Display Error", f"Failed to display images:\n{e}")
 
+    def downsample_for_label(self, img_array, label):
+        """Return a strided (nearest-neighbour) view of the slice no smaller than twice the label."""
+        height, width = img_array.shape[:2]
+        step = max(1, min(height // max(1, 2 * label.height()), width // max(1, 2 * label.width())))
+        return img_array[::step, ::step]
+
+    def scale_pixmaps(self):
+        """Scale the cached pixmaps to fit the labels while maintaining aspect ratio."""
+        if self._orig_qpix is None or self._mod_qpix is None:
+            return
+
+        # Nearest-neighbour is plenty for an interactive preview
+        scaled_original = self._orig_qpix.scaled(
+            self.original_label.size(),
+            Qt.KeepAspectRatio,
+            Qt.FastTransformation
+        )
+        scaled_modified = self._mod_qpix.scaled(
+            self.modified_label.size(),
+            Qt.KeepAspectRatio,
+            Qt.FastTransformation
+        )
+
+        self.original_label.setPixmap(scaled_original)
+        self.modified_label.setPixmap(scaled_modified)
+
+    def resizeEvent(self, event):
+        """Re-scale the cached pixmaps instead of regenerating them from the arrays."""
+        super().resizeEvent(event)
+        self.scale_pixmaps()
+
     def numpy_to_qpixmap(self, img_array):
         """Convert a 2D NumPy array to QPixmap."""
         try:
-            # Normalize the image to 0-255
-            img_normalized = (img_array - np.min(img_array)) / (np.max(img_array) - np.min(img_array))
-            img_uint8 = (img_normalized * 255).astype(np.uint8)
+            if img_array.dtype == np.uint16:
+                return QPixmap.fromImage(self.uint16_to_qimage(img_array))
+
+            # Normalize the image to 0-255 with one min/max pass and a fused scale
+            img_min = img_array.min()
+            img_max = img_array.max()
+            scale = 255.0 / (img_max - img_min) if img_max > img_min else 0.0
+
+            if self._scratch_f32 is None or self._scratch_f32.shape != img_array.shape:
+                self._scratch_f32 = np.empty(img_array.shape, dtype=np.float32)
+            if ne is not None:
+                # numexpr fuses the subtract and scale into one multithreaded pass
+                ne.evaluate('(a - mn) * s', local_dict={'a': img_array, 'mn': img_min, 's': scale},
+                            out=self._scratch_f32, casting='same_kind')
+            else:
+                np.subtract(img_array, img_min, out=self._scratch_f32, dtype=np.float32)
+                np.multiply(self._scratch_f32, scale, out=self._scratch_f32)
+
+            img_uint8 = np.empty(img_array.shape, dtype=np.uint8)
+            img_uint8[...] = self._scratch_f32
+            self._qimage_buffer = img_uint8
 
             # Convert to QImage
             height, width = img_uint8.shape
@@ -97,6 +146,25 @@ class PreviewManager(QWidget):
             print(f"Error converting NumPy array to QPixmap: {e}")
             return QPixmap()  # Return a null pixmap on failure
 
+    def uint16_to_qimage(self, img_array):
+        """Window a uint16 slice to the full 16-bit range in integer arithmetic, no float pass."""
+        img_min = int(img_array.min())
+        img_max = int(img_array.max())
+        # 16.16 fixed-point scale factor, the int64 scratch holds (value - min) * factor
+        factor = (65535 << 16) // (img_max - img_min) if img_max > img_min else 0
+
+        if self._scratch_i64 is None or self._scratch_i64.shape != img_array.shape:
+            self._scratch_i64 = np.empty(img_array.shape, dtype=np.int64)
+            self._scratch_u16 = np.empty(img_array.shape, dtype=np.uint16)
+        np.subtract(img_array, img_min, out=self._scratch_i64, dtype=np.int64)
+        np.multiply(self._scratch_i64, factor, out=self._scratch_i64)
+        np.right_shift(self._scratch_i64, 16, out=self._scratch_i64)
+        self._scratch_u16[...] = self._scratch_i64
+        self._qimage_buffer = self._scratch_u16
+
+        height, width = self._scratch_u16.shape
+        return QImage(self._scratch_u16.data, width, height, 2 * width, QImage.Format_Grayscale16)
+
     def save_as(self):
         # Save the modified image
         file_path, _ = QFileDialog.getSaveFileName(self, "Save Modified Image", "", "NIfTI Files (*.nii *.nii.gz)")
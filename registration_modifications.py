@@ -1,35 +1,95 @@
 # registration_modifications.py
+import os
+import threading
 import SimpleITK as sitk
 import numpy as np
 
-def affine_registration(fixed_image_np, fixed_affine, moving_image_np, moving_affine):
-    """Perform affine registration using SimpleITK."""
-    fixed_image = sitk.GetImageFromArray(fixed_image_np)
-    fixed_image.SetOrigin(fixed_affine[:3, 3])
-    fixed_image.SetDirection(sitk.GetDirectionFromMatrix(fixed_affine[:3, :3]))
-    fixed_image.SetSpacing((1.0, 1.0, 1.0))  # Adjust if necessary
-
-    moving_image = sitk.GetImageFromArray(moving_image_np)
-    moving_image.SetOrigin(moving_affine[:3, 3])
-    moving_image.SetDirection(sitk.GetDirectionFromMatrix(moving_affine[:3, :3]))
-    moving_image.SetSpacing((1.0, 1.0, 1.0))  # Adjust if necessary
-
+# Let ITK filters and metrics use every logical core
+sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(os.cpu_count() or 1)
+
+# Fixed seed for the metric's random sampling, so the same inputs give the same transform
+REGISTRATION_SAMPLING_SEED = 42
+
+# Initial BSpline transforms keyed by fixed image geometry and mesh size
+_bspline_transforms = {}
+
+# Configured registration methods keyed by (transform kind, preview), each with its own lock
+_registration_methods = {}
+_registration_methods_lock = threading.Lock()
+
+def _np_to_sitk(arr, affine):
+    """Wrap a NumPy volume in a float32 SimpleITK image placed by its affine."""
+    # A contiguous float32 input lets sitk take it in a single copy, and registering
+    # float32 images means the pyramid and metric never cast integer inputs
+    image = sitk.GetImageFromArray(np.ascontiguousarray(arr, dtype=np.float32))
+    image.SetOrigin(tuple(affine[:3, 3].tolist()))
+
+    # GetImageFromArray reverses the axes, sitk index (a, b, c) is array[c, b, a], so the
+    # affine's columns go on in reverse order. Physical points stay in the affine's own (RAS)
+    # frame rather than ITK's LPS, which is consistent as long as both images are placed here.
+    zooms = np.linalg.norm(affine[:3, :3], axis=0)
+    rotation = (affine[:3, :3] / zooms)[:, ::-1]
+    image.SetDirection(tuple(rotation.ravel().tolist()))
+    image.SetSpacing(tuple(zooms[::-1].tolist()))
+    return image
+
+def _make_registration_method(shrink_factors=(4, 2, 1), smoothing_sigmas=(2, 1, 0)):
+    """Return an ImageRegistrationMethod with the metric, interpolator and pyramid both registrations share."""
     registration_method = sitk.ImageRegistrationMethod()
 
-    # Similarity metric settings.
-    registration_method.SetMetricAsMeanSquares()
+    # Similarity metric settings: Mattes MI evaluated on a (seeded) random 1% of the voxels.
+    registration_method.SetMetricAsMattesMutualInformation(numberOfHistogramBins=32)
+    registration_method.SetMetricSamplingStrategy(registration_method.RANDOM)
+    registration_method.SetMetricSamplingPercentage(0.01, seed=REGISTRATION_SAMPLING_SEED)  # Same samples every run
 
-    # Interpolator settings.
+    # Interpolator settings: linear is evaluated at every metric sample of every iteration,
+    # and both images are already float32 so ITK does no per-iteration casting.
     registration_method.SetInterpolator(sitk.sitkLinear)
 
+    # Setup for the multi-resolution framework.
+    registration_method.SetShrinkFactorsPerLevel(shrinkFactors=list(shrink_factors))
+    registration_method.SetSmoothingSigmasPerLevel(smoothingSigmas=list(smoothing_sigmas))
+    registration_method.SmoothingSigmasAreSpecifiedInPhysicalUnitsOn()
+    return registration_method
+
+def _build_registration_method(kind, preview):
+    """Configure the metric, pyramid and optimizer for one (kind, preview) combination."""
+    # The preview skips the full-resolution pyramid level
+    if preview:
+        registration_method = _make_registration_method(shrink_factors=[4,2], smoothing_sigmas=[2,1])
+    else:
+        registration_method = _make_registration_method()
+
     # Optimizer settings.
-    registration_method.SetOptimizerAsGradientDescent(learningRate=1.0, numberOfIterations=100)
+    if kind == 'affine':
+        registration_method.SetOptimizerAsGradientDescent(learningRate=1.0, numberOfIterations=100)
+    elif preview:
+        registration_method.SetOptimizerAsLBFGSB(numberOfIterations=20, maximumNumberOfCorrections=5)
+    else:
+        registration_method.SetOptimizerAsLBFGSB()
     registration_method.SetOptimizerScalesFromPhysicalShift()
+    return registration_method
+
+def _cached_registration_method(kind, preview=False):
+    """Return the shared (method, lock) pair for this combination, building it on first use.
+
+    Hold the lock while setting the initial transform and executing, registrations may run
+    concurrently on the modification thread pool.
+    """
+    key = (kind, preview)
+    with _registration_methods_lock:
+        entry = _registration_methods.get(key)
+        if entry is None:
+            entry = (_build_registration_method(kind, preview), threading.Lock())
+            _registration_methods[key] = entry
+    return entry
 
-    # Setup for the multi-resolution framework.
-    registration_method.SetShrinkFactorsPerLevel(shrinkFactors=[4,2,1])
-    registration_method.SetSmoothingSigmasPerLevel(smoothingSigmas=[2,1,0])
-    registration_method.SmoothingSigmasAreSpecifiedInPhysicalUnitsOn()
+def affine_registration(fixed_image_np, fixed_affine, moving_image_np, moving_affine):
+    """Perform affine registration using SimpleITK."""
+    fixed_image = _np_to_sitk(fixed_image_np, fixed_affine)
+    moving_image = _np_to_sitk(moving_image_np, moving_affine)
+
+    registration_method, method_lock = _cached_registration_method('affine')
 
     # Initialize transform.
     initial_transform = sitk.CenteredTransformInitializer(
@@ -38,13 +98,14 @@ def affine_registration(fixed_image_np, fixed_affine, moving_image_np, moving_af
         sitk.AffineTransform(fixed_image.GetDimension()),
         sitk.CenteredTransformInitializerFilter.GEOMETRY
     )
-    registration_method.SetInitialTransform(initial_transform, inPlace=False)
 
     # Execute registration.
-    final_transform = registration_method.Execute(fixed_image, moving_image)
+    with method_lock:
+        registration_method.SetInitialTransform(initial_transform, inPlace=False)
+        final_transform = registration_method.Execute(fixed_image, moving_image)
 
     # Resample moving image.
-    moving_resampled = sitk.Resample(moving_image, fixed_image, final_transform, sitk.sitkLinear, 0.0, moving_image.GetPixelID())
+    moving_resampled = sitk.Resample(moving_image, fixed_image, final_transform, sitk.sitkLinear, 0.0, sitk.sitkFloat32)
 
     # Convert back to NumPy array.
     resampled_np = sitk.GetArrayFromImage(moving_resampled)
@@ -57,45 +118,38 @@ def affine_registration(fixed_image_np, fixed_affine, moving_image_np, moving_af
 
     return resampled_np, new_affine
 
-def non_rigid_registration(fixed_image_np, fixed_affine, moving_image_np, moving_affine):
-    """Perform non-rigid (BSpline) registration using SimpleITK."""
-    fixed_image = sitk.GetImageFromArray(fixed_image_np)
-    fixed_image.SetOrigin(fixed_affine[:3, 3])
-    fixed_image.SetDirection(sitk.GetDirectionFromMatrix(fixed_affine[:3, :3]))
-    fixed_image.SetSpacing((1.0, 1.0, 1.0))  # Adjust if necessary
-
-    moving_image = sitk.GetImageFromArray(moving_image_np)
-    moving_image.SetOrigin(moving_affine[:3, 3])
-    moving_image.SetDirection(sitk.GetDirectionFromMatrix(moving_affine[:3, :3]))
-    moving_image.SetSpacing((1.0, 1.0, 1.0))  # Adjust if necessary
+def _bspline_initial_transform(fixed_image, mesh_size):
+    """Return the initial BSpline transform for this fixed image grid, reusing earlier ones."""
+    key = (fixed_image.GetSize(), fixed_image.GetOrigin(), fixed_image.GetDirection(),
+           fixed_image.GetSpacing(), tuple(mesh_size))
+    transform = _bspline_transforms.get(key)
+    if transform is None:
+        # Safe to share, registration runs with inPlace=False and never modifies it
+        transform = sitk.BSplineTransformInitializer(fixed_image, mesh_size)
+        _bspline_transforms[key] = transform
+    return transform
 
-    registration_method = sitk.ImageRegistrationMethod()
-
-    # Similarity metric settings.
-    registration_method.SetMetricAsMeanSquares()
+def non_rigid_registration(fixed_image_np, fixed_affine, moving_image_np, moving_affine, preview=False):
+    """Perform non-rigid (BSpline) registration using SimpleITK.
 
-    # Interpolator settings.
-    registration_method.SetInterpolator(sitk.sitkLinear)
+    preview=True runs a cheaper two-level pyramid on a coarser mesh with fewer iterations.
+    """
+    fixed_image = _np_to_sitk(fixed_image_np, fixed_affine)
+    moving_image = _np_to_sitk(moving_image_np, moving_affine)
 
-    # Optimizer settings.
-    registration_method.SetOptimizerAsLBFGSB()
-    registration_method.SetOptimizerScalesFromPhysicalShift()
-
-    # Setup for the multi-resolution framework.
-    registration_method.SetShrinkFactorsPerLevel(shrinkFactors=[4,2,1])
-    registration_method.SetSmoothingSigmasPerLevel(smoothingSigmas=[2,1,0])
-    registration_method.SmoothingSigmasAreSpecifiedInPhysicalUnitsOn()
+    registration_method, method_lock = _cached_registration_method('bspline', preview)
 
     # Initialize transform.
-    transform_domain_mesh_size = [8]*fixed_image.GetDimension()
-    initial_transform = sitk.BSplineTransformInitializer(fixed_image, transform_domain_mesh_size)
-    registration_method.SetInitialTransform(initial_transform, inPlace=False)
+    transform_domain_mesh_size = [4 if preview else 8]*fixed_image.GetDimension()
+    initial_transform = _bspline_initial_transform(fixed_image, transform_domain_mesh_size)
 
     # Execute registration.
-    final_transform = registration_method.Execute(fixed_image, moving_image)
+    with method_lock:
+        registration_method.SetInitialTransform(initial_transform, inPlace=False)
+        final_transform = registration_method.Execute(fixed_image, moving_image)
 
     # Resample moving image.
-    moving_resampled = sitk.Resample(moving_image, fixed_image, final_transform, sitk.sitkLinear, 0.0, moving_image.GetPixelID())
+    moving_resampled = sitk.Resample(moving_image, fixed_image, final_transform, sitk.sitkLinear, 0.0, sitk.sitkFloat32)
 
     # Convert back to NumPy array.
     resampled_np = sitk.GetArrayFromImage(moving_resampled)
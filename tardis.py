@@ -1,47 +1,300 @@
 # tardis.py
 import sys
 import nibabel as nib
-from nibabel.processing import resample_from_to
 import numpy as np
-import SimpleITK as sitk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5.QtWidgets import (
     QMainWindow, QApplication, QVBoxLayout, QPushButton, QSlider, QWidget, QLabel,
     QHBoxLayout, QCheckBox, QScrollArea, QGridLayout, QFileDialog, QSizePolicy,
     QDesktopWidget, QMenuBar, QAction, QMessageBox, QDialog, QLineEdit, QSplitter, QRadioButton, QButtonGroup
 )
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QMimeData, QSize
-from PyQt5.QtGui import QIcon, QPixmap, QImage, QDrag
+from PyQt5.QtCore import (
+    Qt, QTimer, QThreadPool, QRunnable, QObject, pyqtSignal, pyqtSlot, QMimeData, QSize, QRect
+)
+from PyQt5.QtGui import QIcon, QPixmap, QImage, QDrag, QPainter
 import os
+import hashlib
+from collections import OrderedDict
+import threading
+import time
 from app_utils import handle_file_upload, extract_slice, clean_nifti_dir
 from functools import partial
 
 from history_stack import HistoryStack
 
-# Import modification functions
-from registration_modifications import affine_registration, non_rigid_registration
-from filtering_modifications import apply_gaussian_filter, apply_median_filter, apply_non_local_means
+# SimpleITK and the modification modules (which pull in scipy, skimage and ITK) are
+# imported where they are first used, so the window opens without loading them
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, display normalization falls back to NumPy
+    njit = None
+
+if njit is not None:
+    @njit(nogil=True, fastmath=True, cache=True)
+    def _scale_to_u8(src, dst, lo, scale):
+        """Write (src - lo) * scale into a uint8 buffer in one loop, without float temporaries."""
+        for i in range(src.shape[0]):
+            for j in range(src.shape[1]):
+                dst[i, j] = np.int32((np.float32(src[i, j]) - lo) * scale)
+
+    @njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _rescale_kernel(src, dst, lo, scale, offset):
+        """dst = (src - lo) * scale + offset over flat arrays, in one multi-threaded pass."""
+        for i in prange(src.shape[0]):
+            dst[i] = (np.float32(src[i]) - lo) * scale + offset
+
+    @njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _linear_zoom_kernel(src, dst, x0, x1, wx, y0, y1, wy, z0, z1, wz):
+        """Trilinear resampling of Fortran-ordered (x, y, z, t) src into dst from per-axis tables.
+
+        A negative x0/y0/z0 marks output voxels outside the input, which are set to 0.
+        Threads take whole output planes and x, the stride-1 axis, is innermost: each output
+        row reads four input rows, which are still in cache for the next output row.
+        """
+        n_x, n_y, n_z, n_t = dst.shape
+        for plane in prange(n_t * n_z):
+            t = plane // n_z
+            k = plane - t * n_z
+            if z0[k] < 0:
+                dst[:, :, k, t] = 0
+                continue
+            az = wz[k]
+            for j in range(n_y):
+                if y0[j] < 0:
+                    dst[:, j, k, t] = 0
+                    continue
+                ay = wy[j]
+                for i in range(n_x):
+                    if x0[i] < 0:
+                        dst[i, j, k, t] = 0
+                        continue
+                    c00 = src[x0[i], y0[j], z0[k], t] * (1 - az) + src[x0[i], y0[j], z1[k], t] * az
+                    c01 = src[x0[i], y1[j], z0[k], t] * (1 - az) + src[x0[i], y1[j], z1[k], t] * az
+                    c10 = src[x1[i], y0[j], z0[k], t] * (1 - az) + src[x1[i], y0[j], z1[k], t] * az
+                    c11 = src[x1[i], y1[j], z0[k], t] * (1 - az) + src[x1[i], y1[j], z1[k], t] * az
+                    ax = wx[i]
+                    dst[i, j, k, t] = (c00 * (1 - ay) + c01 * ay) * (1 - ax) + (c10 * (1 - ay) + c11 * ay) * ax
+
+RANGE_BLOCK_SIZE = 2 ** 18  # Elements per block, small enough to stay in cache between min and max
+
+def volume_range(data):
+    """(min, max) of a whole volume, reading it from memory (or disk, for memmaps) only once.
+
+    Both reductions run block by block, so max() finds each block still in cache after min().
+    """
+    if data.size <= RANGE_BLOCK_SIZE or not (data.flags.c_contiguous or data.flags.f_contiguous):
+        return data.min(), data.max()
+    flat = np.asarray(data).ravel(order='K')  # A view for contiguous arrays, memmaps included
+    n_blocks = -(-flat.size // RANGE_BLOCK_SIZE)
+    lows = np.empty(n_blocks, dtype=flat.dtype)
+    highs = np.empty(n_blocks, dtype=flat.dtype)
+    for i in range(n_blocks):
+        block = flat[i * RANGE_BLOCK_SIZE:(i + 1) * RANGE_BLOCK_SIZE]
+        lows[i] = block.min()
+        highs[i] = block.max()
+    return lows.min(), highs.max()
+
+def normalize_to_u8(slice_data, u8_buf, tmp_f32, lo=None, hi=None):
+    """Map [lo, hi] of a 2D slice to 0-255 in u8_buf, tmp_f32 is same-shaped float32 scratch.
+
+    lo and hi default to the slice's own min and max.
+    """
+    # Python floats, so the range of a wide int16 slice can't overflow
+    lo = float(slice_data.min() if lo is None else lo)
+    hi = float(slice_data.max() if hi is None else hi)
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+    if njit is not None:
+        # NumPy's SIMD min/max, then one compiled pass (built once per slice dtype and layout)
+        _scale_to_u8(slice_data, u8_buf, np.float32(lo), np.float32(scale))
+    else:
+        # Normalize the data in one fused pass into the reused buffers
+        np.subtract(slice_data, lo, out=tmp_f32, dtype=np.float32)
+        np.multiply(tmp_f32, scale, out=tmp_f32)
+        u8_buf[...] = tmp_f32
+    return u8_buf
+
+def lut_supported(dtype):
+    """Whether build_display_lut can cover every value of dtype (8 and 16-bit integers)."""
+    return dtype.kind in 'iu' and dtype.itemsize <= 2
+
+def build_display_lut(dtype, lo, hi):
+    """uint8 table mapping [lo, hi] to 0-255 for every value of an 8/16-bit integer dtype.
+
+    The table is indexed by the unsigned view of each value, so signed data needs no offset
+    per frame: np.take(lut, slice_data.view(f'u{dtype.itemsize}')).
+    """
+    values = np.arange(2 ** (8 * dtype.itemsize), dtype=f'u{dtype.itemsize}')
+    values = values.view(dtype).astype(np.float32)
+    lo = float(lo)
+    hi = float(hi)
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+    return np.clip((values - lo) * scale, 0, 255).astype(np.uint8)
+
+def prepare_comparison_volume(image_data):
+    """Return (volume, lut) for ComparisonWidget.set_prepared_image.
+
+    The volume is transposed once to (z[, t], x, y) so every displayed slice is C-contiguous,
+    and lut is the volume's display table for 8/16-bit integer data (None otherwise).
+    """
+    volume = np.ascontiguousarray(np.transpose(image_data, (2, 3, 0, 1) if image_data.ndim == 4 else (2, 0, 1)))
+    lut = build_display_lut(volume.dtype, *volume_range(volume)) if lut_supported(volume.dtype) else None
+    return volume, lut
+
+def load_comparison_volume(file_path):
+    """Read a file and prepare it for the comparison widget, safe to call off the GUI thread."""
+    # Memory-mapped and in its stored dtype, the transpose then makes the only in-memory copy
+    nii_file = nib.load(file_path, mmap=True)
+    return prepare_comparison_volume(np.asanyarray(nii_file.dataobj))
+
+def decompress_volume(nii_file):
+    """Return (nii_file, in-memory image of its voxels), safe to call off the GUI thread.
+
+    Unscaled voxels stay in their stored dtype (usually int16, a quarter of float64) and
+    are only converted to float32 by NiftiViewer.img_data when a modification needs them.
+    """
+    proxy = nii_file.dataobj
+    if proxy.slope == 1 and proxy.inter == 0 and nii_file.get_data_dtype().itemsize <= 4:
+        voxels = np.asanyarray(proxy)
+    else:  # Scaled or 64-bit data would come out as float64
+        voxels = nii_file.get_fdata(dtype=np.float32, caching='unchanged')
+    return nii_file, nib.Nifti1Image(voxels, nii_file.affine)
+
+# Shared linear resampler, SimpleITK keeps its interpolator and transform between calls
+_resampler = None  # Created by get_resampler on first use
+_resampler_lock = threading.Lock()  # Modifications may run on several threads
+
+def get_resampler():
+    """Return the shared ResampleImageFilter, hold _resampler_lock while calling this and using it."""
+    global _resampler
+    if _resampler is None:
+        import SimpleITK as sitk
+        _resampler = sitk.ResampleImageFilter()
+        _resampler.SetInterpolator(sitk.sitkLinear)
+        _resampler.SetOutputPixelType(sitk.sitkFloat32)
+        _resampler.SetNumberOfThreads(os.cpu_count() or 1)
+    return _resampler
+
+def _linear_zoom_tables(n_in, n_out, factor):
+    """Neighbour indices and weights along one axis for output voxel i at input index i / factor.
+
+    Matches SimpleITK's linear interpolator: samples within half a voxel past the last
+    input voxel take its value, samples beyond that are outside (marked by index -1).
+    """
+    coords = np.arange(n_out) / factor
+    lower = np.floor(coords).astype(np.intp)
+    weights = (coords - lower).astype(np.float32)
+    upper = np.minimum(lower + 1, n_in - 1)
+    lower[coords >= n_in - 0.5] = -1
+    return lower, upper, weights
+
+THUMBNAIL_SIZE = 170  # Thumbnail edge in pixels
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tardis')
+THUMBNAIL_CACHE_MAX_FILES = 500  # Least recently used thumbnails past this are pruned
+THUMBNAIL_CACHE_MAX_AGE_DAYS = 30  # As are thumbnails not used for this long
+DECODED_VOLUME_CACHE_SIZE = 3  # Decompressed .nii.gz volumes kept for switching back to them
+
+def thumbnail_image(file_path):
+    """Return the sidebar thumbnail for a NIfTI file, rendered from its middle slice.
+
+    Rendered thumbnails are kept as PNGs in THUMBNAIL_CACHE_DIR, keyed by the file's path,
+    modification time and size, so re-adding an unchanged file doesn't read it again.
+    Only QImage is used, so this is safe to call off the GUI thread.
+    """
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{THUMBNAIL_SIZE}"
+    cache_path = os.path.join(THUMBNAIL_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + '.png')
+
+    thumbnail = QImage(cache_path) if os.path.exists(cache_path) else QImage()
+    if not thumbnail.isNull():
+        try:
+            os.utime(cache_path)  # Mark it as recently used for prune_thumbnail_cache
+        except OSError:
+            pass
+    else:
+        middle_slice = extract_slice(nib.load(file_path), max_size=THUMBNAIL_SIZE)
+        slice_u8 = normalize_to_u8(middle_slice, np.empty(middle_slice.shape, dtype=np.uint8),
+                                   np.empty(middle_slice.shape, dtype=np.float32))
+        height, width = slice_u8.shape
+        image = QImage(slice_u8.data, width, height, slice_u8.strides[0], QImage.Format_Grayscale8)
+        image = image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+        # Center the slice on a black square so every thumbnail has the same size
+        thumbnail = QImage(THUMBNAIL_SIZE, THUMBNAIL_SIZE, QImage.Format_RGB32)
+        thumbnail.fill(Qt.black)
+        painter = QPainter(thumbnail)
+        painter.drawImage((THUMBNAIL_SIZE - image.width()) // 2, (THUMBNAIL_SIZE - image.height()) // 2, image)
+        painter.end()
+
+        try:
+            os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+            thumbnail.save(cache_path, 'PNG')
+        except OSError:
+            pass  # The cache is only an optimization
+
+    return thumbnail
+
+def prune_thumbnail_cache():
+    """Delete cached thumbnails unused for THUMBNAIL_CACHE_MAX_AGE_DAYS, then the least
+    recently used ones past THUMBNAIL_CACHE_MAX_FILES.
+
+    Entries for edited or removed files are never hit again, so this is what bounds the cache.
+    """
+    try:
+        with os.scandir(THUMBNAIL_CACHE_DIR) as entries:
+            cached = [(entry.stat().st_mtime, entry.path) for entry in entries
+                      if entry.name.endswith('.png') and entry.is_file()]
+    except OSError:
+        return  # No cache yet
+    cached.sort(reverse=True)  # Most recently used first
+    oldest_kept = time.time() - THUMBNAIL_CACHE_MAX_AGE_DAYS * 24 * 3600
+    for i, (mtime, path) in enumerate(cached):
+        if i >= THUMBNAIL_CACHE_MAX_FILES or mtime < oldest_kept:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
 
-# Import threading for background processing
-class ModificationThread(QThread):
+# Background processing runs as jobs on the shared QThreadPool
+class ModificationSignals(QObject):
     modification_complete = pyqtSignal(object, object)  # Emits modified_data and new_affine
 
+
+class ModificationJob(QRunnable):
     def __init__(self, func, *args, **kwargs):
         super().__init__()
         self.func = func
         self.args = args
         self.kwargs = kwargs
+        self.signals = ModificationSignals()  # QRunnable is not a QObject, so it cannot emit itself
 
+    @pyqtSlot()
     def run(self):
         try:
             result = self.func(*self.args, **self.kwargs)
-            self.modification_complete.emit(*result)
+            self.signals.modification_complete.emit(*result)
         except Exception as e:
-            self.modification_complete.emit(None, None)
+            self.signals.modification_complete.emit(None, None)
             print(f"Modification failed: {e}")
 
 
+class ThumbnailSignals(QObject):
+    thumbnail_ready = pyqtSignal(str, QImage)  # Emits file_path and its thumbnail
+
+
+class ThumbnailJob(QRunnable):
+    def __init__(self, file_path):
+        super().__init__()
+        self.file_path = file_path
+        self.signals = ThumbnailSignals()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            self.signals.thumbnail_ready.emit(self.file_path, thumbnail_image(self.file_path))
+        except Exception as e:
+            print(f"Error creating thumbnail for file: {self.file_path}\n{e}")
+
+
 class ResamplingDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -259,7 +512,7 @@ class FilteringDialog(QDialog):
         self.gaussian_param_layout = QHBoxLayout()
         self.gaussian_label = QLabel("Sigma:")
         self.gaussian_input = QLineEdit()
-        self.gaussian_input.setPlaceholderText("e.g., 1.0")
+        self.gaussian_input.setPlaceholderText("e.g., 1.0 or 1.0, 1.0, 0")
         self.gaussian_param_layout.addWidget(self.gaussian_label)
         self.gaussian_param_layout.addWidget(self.gaussian_input)
         self.gaussian_param_widget = QWidget()
@@ -323,7 +576,9 @@ class FilteringDialog(QDialog):
         try:
             # Determine which filter is selected and store the parameters
             if self.gaussian_radio.isChecked():
-                sigma = float(self.gaussian_input.text())
+                # A single sigma, or one per axis separated by commas (0 skips an axis)
+                sigmas = [float(value) for value in self.gaussian_input.text().split(',')]
+                sigma = sigmas[0] if len(sigmas) == 1 else tuple(sigmas)
                 self.selected_filters = {'type': 'gaussian', 'sigma': sigma}
             elif self.median_radio.isChecked():
                 kernel_size = int(self.median_input.text())
@@ -380,6 +635,13 @@ class ComparisonWidget(QWidget):
         self.slice_idx = 0  # Initialize the Z-axis slice index
         self.time_idx = 0  # Initialize the time index for 4D images
         self.is_4d = False  # Track if the image is 4D
+        self.image_data = None  # Set by set_image, cleared by close_comparison
+        self._u8_buf = None  # Display buffers, reallocated per image in set_image
+        self._tmp_f32 = None
+        self._lut = None  # uint8 lookup table for 8/16-bit integer volumes
+        self._qimage = None  # QImage view over _u8_buf, rebuilt only when the volume or step changes
+        self._target_hw = None  # Label size cached on resize, used to pick the display stride
+        self._step = 1
 
     def init_ui(self):
         layout = QVBoxLayout()
@@ -389,6 +651,8 @@ class ComparisonWidget(QWidget):
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setStyleSheet("background-color: #000000; color: white;") # grey 2E2E2E
         self.image_label.setScaledContents(False)
+        # Let the layout size the label, the display stride then follows the label
+        self.image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
         layout.addWidget(self.image_label)
 
         # Close Button
@@ -428,9 +692,15 @@ class ComparisonWidget(QWidget):
 
     def set_image(self, image_data):
         """Set and display the image in the ComparisonWidget."""
+        self.set_prepared_image(*prepare_comparison_volume(image_data))
+
+    def set_prepared_image(self, volume, lut):
+        """Display a volume from prepare_comparison_volume, which may run off the GUI thread."""
         try:
-            self.image_data = image_data
-            self.is_4d = image_data.ndim == 4  # Check if the image is 4D
+            self.is_4d = volume.ndim == 4  # Check if the image is 4D
+            self.image_data = volume
+            self._lut = lut
+            self.allocate_display_buffers()
 
             # Remove old sliders if they exist
             if self.slice_slider is not None:
@@ -442,14 +712,14 @@ class ComparisonWidget(QWidget):
 
             # Recreate the slice slider (Z-axis)
             self.slice_slider = QSlider(Qt.Horizontal)
-            self.slice_slider.setMaximum(self.image_data.shape[2] - 1)
+            self.slice_slider.setMaximum(self.image_data.shape[0] - 1)
             self.slice_slider.valueChanged.connect(self.update_slice)
             self.layout().addWidget(self.slice_slider)
 
             # Recreate the time slider (T-axis) only for 4D images
             if self.is_4d:
                 self.time_slider = QSlider(Qt.Horizontal)
-                self.time_slider.setMaximum(self.image_data.shape[3] - 1)
+                self.time_slider.setMaximum(self.image_data.shape[1] - 1)
                 self.time_slider.valueChanged.connect(self.update_time)
                 self.layout().addWidget(self.time_slider)
                 self.time_slider.setVisible(True)
@@ -463,6 +733,33 @@ class ComparisonWidget(QWidget):
             print(f"Failed to set comparison image: {e}")
             QMessageBox.critical(self, "Error", f"Failed to set comparison image:\n{e}")
 
+    def display_step(self):
+        """Return the smallest stride at which a slice fits inside the label."""
+        if self._target_hw is None:
+            return 1
+        height, width = self.image_data.shape[-2:]
+        target_h, target_w = self._target_hw
+        return max(1, -(-height // target_h), -(-width // target_w))
+
+    def allocate_display_buffers(self):
+        """(Re)allocate the display buffers for the current volume and display stride."""
+        self._step = self.display_step()
+        shape = self.image_data[..., ::self._step, ::self._step].shape[-2:]
+        self._u8_buf = np.empty(shape, dtype=np.uint8)
+        self._tmp_f32 = np.empty(shape, dtype=np.float32)
+        # The QImage wraps _u8_buf without copying, so refilling the buffer updates it
+        height, width = shape
+        self._qimage = QImage(self._u8_buf.data, width, height, self._u8_buf.strides[0], QImage.Format_Grayscale8)
+
+    def resizeEvent(self, event):
+        """Pick a new display stride when the label is resized."""
+        super().resizeEvent(event)
+        if self.image_label.height() > 0 and self.image_label.width() > 0:
+            self._target_hw = (self.image_label.height(), self.image_label.width())
+        if getattr(self, 'image_data', None) is not None and self.display_step() != self._step:
+            self.allocate_display_buffers()
+            self.update_display()
+
     def reconnect_signals(self):
         """Reconnect signals for sliders."""
         self.slice_slider.valueChanged.connect(self.update_slice)
@@ -488,24 +785,23 @@ class ComparisonWidget(QWidget):
             if self.is_4d:
                 # For 4D images, use both the slice and time index
                 if self.slice_slider and self.time_slider:
-                    slice_data = self.image_data[:, :, self.slice_slider.value(), self.time_slider.value()]
+                    slice_data = self.image_data[self.slice_slider.value(), self.time_slider.value()]
             else:
                 # For 3D images, use only the slice index
                 if self.slice_slider:
-                    slice_data = self.image_data[:, :, self.slice_slider.value()]
+                    slice_data = self.image_data[self.slice_slider.value()]
 
-            # Normalize the data for display
-            normalized = ((slice_data - np.min(slice_data)) / (np.max(slice_data) - np.min(slice_data)) * 255).astype(
-                np.uint8)
-            height, width = normalized.shape
+            # Strided nearest-neighbour view, sized to fit the label
+            slice_data = slice_data[::self._step, ::self._step]
 
-            # Ensure the data is contiguous in memory
-            if not normalized.flags['C_CONTIGUOUS']:
-                normalized = np.ascontiguousarray(normalized)
+            if self._lut is not None:
+                # Integer volumes: one table lookup per pixel, indexed by the raw bit pattern
+                np.take(self._lut, slice_data.view(f'u{slice_data.dtype.itemsize}'), out=self._u8_buf)
+            else:
+                normalize_to_u8(slice_data, self._u8_buf, self._tmp_f32)
 
-            # Convert numpy array to QImage
-            q_image = QImage(normalized.data, width, height, width, QImage.Format_Grayscale8)
-            pixmap = QPixmap.fromImage(q_image)
+            # _qimage already views _u8_buf, only the pixmap upload happens per frame
+            pixmap = QPixmap.fromImage(self._qimage)
 
             # Set the pixmap to the label
             self.image_label.setPixmap(pixmap)
@@ -522,6 +818,7 @@ class ComparisonWidget(QWidget):
 
             # Clear image data
             self.image_data = None
+            self._qimage = None
 
             # Clean up sliders properly by deleting them, but only if they exist
             if self.slice_slider is not None:
@@ -541,6 +838,37 @@ class ComparisonWidget(QWidget):
             QMessageBox.critical(self, "Error", f"Failed to close comparison:\n{e}")
 
 
+class ScaledImageLabel(QLabel):
+    """QLabel that keeps its source pixmap and paints it scaled to fit, aspect preserved."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._source_pixmap = None
+        self.setAlignment(Qt.AlignCenter)
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)  # Don't grow to the pixmap
+
+    def set_source_pixmap(self, pixmap):
+        # Only repaint: no scaled copy and no setPixmap, which would also redo the layout
+        self._source_pixmap = pixmap
+        self.update()
+
+    def clear(self):
+        self._source_pixmap = None
+        super().clear()
+        self.update()
+
+    def paintEvent(self, event):
+        if self._source_pixmap is None:
+            super().paintEvent(event)
+            return
+        target = QSize(self._source_pixmap.size()).scaled(self.size(), Qt.KeepAspectRatio)
+        rect = QRect(0, 0, target.width(), target.height())
+        rect.moveCenter(self.rect().center())
+        # Scaled while drawing, without smoothing: nearest-neighbour keeps voxels crisp
+        painter = QPainter(self)
+        painter.drawPixmap(rect, self._source_pixmap)
+        painter.end()
+
+
 class NiftiViewer(QMainWindow):
     def __init__(self, initial_file=None):
         super().__init__()
@@ -550,11 +878,19 @@ class NiftiViewer(QMainWindow):
         self.uploaded_files = {}
         self.thumbnail_containers = {}
         self.current_file = None
-        self.img_data = None
+        self.comparison_file_path = None  # File shown in the comparison widget
+        self._pending_comparison_path = None  # File being read for it on the thread pool
+        self._nifti_images = {}  # path -> ((mtime, size), nibabel image), see open_nifti
+        self._decoded_volumes = OrderedDict()  # path -> (nibabel image, in-memory image), see cached_volume
+        self._pending_active_path = None  # .nii.gz file being decompressed for set_active_file
+        self._img_nii = None  # Image of the active file while its voxels are read slice by slice
+        self._img_data = None
         self.img_affine = None
         self.slice_idx = 0
         self.time_idx = 0
         self.playing = False
+        self.playback_start = 0.0  # perf_counter() time the CINE frame schedule counts from
+        self.playback_ticks = 0
         self.dark_mode_enabled = True
         self.playback_speed = 100
 
@@ -564,9 +900,19 @@ class NiftiViewer(QMainWindow):
         # Initialize history stack
         self.history = HistoryStack()
 
-        # Timer for frame updates
+        # Modifications reuse pooled worker threads instead of starting a QThread each
+        self.thread_pool = QThreadPool.globalInstance()
+        self.thread_pool.setMaxThreadCount(os.cpu_count() or 1)
+        prune_thumbnail_cache()  # Before this session's thumbnail jobs touch their entries
+
+        # Timer for frame updates, single-shot so each frame schedules the next one
         self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
         self.timer.timeout.connect(self.next_frame)
+        self.slice_timer = QTimer(self)
+        self.slice_timer.setSingleShot(True)
+        self.slice_timer.setInterval(16)  # About one display refresh
+        self.slice_timer.timeout.connect(self.update_image)
 
         # Get monitor resolution and resize accordingly
         self.screen_resolution = QApplication.desktop().screenGeometry()
@@ -614,20 +960,25 @@ class NiftiViewer(QMainWindow):
         self.scroll_area.setWidgetResizable(True)
         self.scroll_area.setFixedWidth(250)  # Fixed width for thumbnails
         self.splitter.addWidget(self.scroll_area)
-        self.thumbnail_widgets = {}  # Dictionary to store thumbnails
 
         # Central area: Image display and controls
         central_widget = QWidget()
         self.right_layout = QVBoxLayout()  # Define right_layout for central content
         central_widget.setLayout(self.right_layout)
 
-        # Canvas for displaying the image
-        self.figure, self.ax = plt.subplots(figsize=(8, 8))
-        self.ax.set_anchor('C')  # Center the image initially
-        self.canvas = FigureCanvas(self.figure)
-        self.canvas.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.canvas.updateGeometry()
-        self.right_layout.addWidget(self.canvas)
+        # Label for displaying the image, slices are normalized into a reused uint8 buffer
+        self.main_image_label = ScaledImageLabel()
+        self._main_u8 = None
+        self._main_f32 = None
+        self._main_qimage = None  # QImage view over _main_u8
+        self._display_range = None  # (min, max) of the active volume, the main view's window
+        self._display_lut = None  # Table for that window, for 8/16-bit integer slices
+        self._cine_u8 = None  # Every frame of the shown CINE slice, rendered ahead of playback
+        self._cine_frames = None  # QImage views over _cine_u8, one per frame
+        self._cine_slice_idx = None  # Slice that _cine_u8 was rendered for
+        self._draw_frame = None  # draw_slice or draw_cine_frame, chosen per volume by update_image
+        self._slice_index_tail = ()
+        self.right_layout.addWidget(self.main_image_label, stretch=1)
 
         # Buttons and sliders for controls
         self.add_controls()
@@ -730,7 +1081,7 @@ class NiftiViewer(QMainWindow):
             return
 
         try:
-            nii_file = nib.load(self.current_file)
+            nii_file = self.open_nifti(self.current_file)  # Only header fields are read here
             img_shape = nii_file.shape
             header = nii_file.header
             img_spacing = header.get_zooms()
@@ -772,20 +1123,32 @@ class NiftiViewer(QMainWindow):
         try:
             print(f"Attempting to load comparison file: {file_path}")  # Debugging
 
-            # Load the NIfTI file using nibabel
-            nii_file = nib.load(file_path)
-            comparison_data = nii_file.get_fdata()
-
-            # Display the full image in the ComparisonWidget (3D or 4D)
-            self.comparison_widget.set_image(comparison_data)
-
-            # Resize the main image display to accommodate the comparison
-            self.resize_main_image()
+            # Read, decompress and transpose the volume on the thread pool, not the GUI thread
+            self._pending_comparison_path = file_path
+            job = ModificationJob(load_comparison_volume, file_path)
+            job.signals.modification_complete.connect(partial(self.on_comparison_loaded, file_path))
+            self.thread_pool.start(job)
 
         except Exception as e:
             print(f"Error loading comparison file: {file_path}\n{e}")  # Debugging the error
             QMessageBox.critical(self, "Error", f"Failed to load comparison file:\n{e}")
 
+    def on_comparison_loaded(self, file_path, volume, lut):
+        """Show a volume read by load_comparison_file, unless another file was dropped since."""
+        if file_path != self._pending_comparison_path:
+            return
+        self._pending_comparison_path = None
+        if volume is None:
+            QMessageBox.critical(self, "Error", f"Failed to load comparison file:\n{file_path}")
+            return
+
+        # Display the full image in the ComparisonWidget (3D or 4D)
+        self.comparison_widget.set_prepared_image(volume, lut)
+        self.comparison_file_path = file_path
+
+        # Resize the main image display to accommodate the comparison
+        self.resize_main_image()
+
     def resize_main_image(self):
         """Resize the main image display to accommodate the comparison."""
         if self.comparison_widget.isVisible():
@@ -802,14 +1165,112 @@ class NiftiViewer(QMainWindow):
         except Exception as e:
             print(f"Error selecting file from thumbnail: {e}")
 
+    def open_nifti(self, file_path):
+        """nib.load(file_path), memoised per path until the file changes or is removed."""
+        stat = os.stat(file_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._nifti_images.get(file_path)
+        if cached is None or cached[0] != key:
+            cached = self._nifti_images[file_path] = (key, nib.load(file_path))
+        return cached[1]
+
+    def cached_volume(self, file_path, nii_file):
+        """Decompressed image of a .nii.gz file if it is still cached, else None."""
+        cached = self._decoded_volumes.get(file_path)
+        if cached is None or cached[0] is not nii_file:  # open_nifti reloads files that changed
+            return None
+        self._decoded_volumes.move_to_end(file_path)  # Now the most recently used
+        return cached[1]
+
+    def cache_volume(self, file_path, nii_file, image):
+        """Keep a decompressed image, dropping the least recently used ones past the cache size."""
+        self._decoded_volumes[file_path] = (nii_file, image)
+        self._decoded_volumes.move_to_end(file_path)
+        while len(self._decoded_volumes) > DECODED_VOLUME_CACHE_SIZE:
+            self._decoded_volumes.popitem(last=False)
+
+    @property
+    def img_data(self):
+        """The active volume, read or converted to float32 on first access if it is still in its stored form."""
+        if self._img_data is None and self._img_nii is not None:
+            # 'unchanged' keeps nibabel from also caching the array on the memoised image
+            self._img_data = self._img_nii.get_fdata(dtype=np.float32, caching='unchanged')
+            self._img_nii = None
+        return self._img_data
+
+    @img_data.setter
+    def img_data(self, value):
+        self._img_data = value
+        self._img_nii = None
+        self._display_range = None
+        self._display_lut = None
+        self._cine_u8 = None
+        self._cine_frames = None
+        self._cine_slice_idx = None
+        self._draw_frame = None
+
+    @property
+    def img_shape(self):
+        """Shape of the active volume, without reading it."""
+        if self._img_data is not None:
+            return self._img_data.shape
+        return self._img_nii.shape
+
+    def display_range(self):
+        """Intensity range of the whole active volume, computed once per volume.
+
+        Every slice and frame is windowed by it, so CINE frames don't flicker as they would
+        if each one were stretched to its own range.
+        """
+        if self._display_range is None:
+            if self._img_data is not None:
+                volume = self._img_data
+            else:
+                volume = np.asanyarray(self._img_nii.dataobj)  # Memory-mapped or decompressed, not converted
+            self._display_range = volume_range(volume)
+        return self._display_range
+
+    def img_data_view(self):
+        """Read-only view of img_data to hand to a modification.
+
+        Modifications must return a new array rather than write into their input, so the
+        volume isn't copied for them; the view makes any in-place write raise instead.
+        """
+        view = self.img_data.view()
+        view.flags.writeable = False
+        return view
+
+    def read_slice(self, index):
+        """Return img_data[index], read straight from the file if the volume isn't loaded."""
+        if self._img_data is None and self._img_nii is not None:
+            return np.asanyarray(self._img_nii.dataobj[index])
+        return self._img_data[index]
+
     def set_active_file(self, file_path):
-        """Set the clicked file as the active file for viewing."""
+        """Set the clicked file as the active file for viewing.
+
+        A .nii.gz file that isn't decompressed yet is first read on the thread pool, the
+        current file stays on screen until on_volume_decompressed shows it.
+        """
         try:
+            nii_file = self.open_nifti(file_path)
+            image = nii_file  # Uncompressed files are memory-mapped, slices are read on demand
+            if file_path.endswith('.gz'):
+                # Each slice read from a gzip stream decompresses it from the start, so load it once
+                image = self.cached_volume(file_path, nii_file)
+                if image is None:
+                    self._pending_active_path = file_path
+                    job = ModificationJob(decompress_volume, nii_file)
+                    job.signals.modification_complete.connect(partial(self.on_volume_decompressed, file_path))
+                    self.thread_pool.start(job)
+                    return
+
+            self._pending_active_path = None  # A file shown now wins over one still being read
             self.current_file = file_path
-            nii_file = nib.load(file_path)
-            self.img_data = nii_file.get_fdata()
+            self.img_data = None
+            self._img_nii = image
             self.img_affine = nii_file.affine  # Store affine matrix
-            self.slice_idx = self.img_data.shape[2] // 2  # Default middle slice
+            self.slice_idx = self.img_shape[2] // 2  # Default middle slice
             self.time_idx = 0  # Reset time index when switching files
             self.update_image()
 
@@ -822,32 +1283,49 @@ class NiftiViewer(QMainWindow):
         except Exception as e:
             print(f"Error activating file: {file_path}\n{e}")
 
+    def on_volume_decompressed(self, file_path, nii_file, image):
+        """Show a file read for set_active_file, unless another file was chosen since."""
+        if file_path != self._pending_active_path:
+            return
+        self._pending_active_path = None
+        if image is None:
+            QMessageBox.critical(self, "Error", f"Failed to load file:\n{file_path}")
+            return
+        self.cache_volume(file_path, nii_file, image)
+        self.set_active_file(file_path)
+
     def wheelEvent(self, event):
         """Handle mouse wheel events for scrolling through frames or slices."""
         angle = event.angleDelta().y()  # Get the amount of scroll
         delta = 1 if angle > 0 else -1  # Determine direction of scroll
 
-        if len(self.img_data.shape) == 4 and self.img_data.shape[3] > 1:
+        if len(self.img_shape) == 4 and self.img_shape[3] > 1:
             # CINE mode (scroll through frames)
-            self.time_idx = (self.time_idx + delta) % self.img_data.shape[3]
-            self.update_image()
+            self.time_idx = (self.time_idx + delta) % self.img_shape[3]
+            # Fast wheels send many ticks per display refresh, draw the latest one at most once per interval
+            if not self.slice_timer.isActive():
+                self.slice_timer.start()
         else:
             # 3D mode (scroll through slices)
-            self.slice_idx = np.clip(self.slice_idx + delta, 0, self.img_data.shape[2] - 1)
-            self.slice_slider.setValue(self.slice_idx)  # Update the slider
-            self.update_image()
+            slice_idx = int(np.clip(self.slice_idx + delta, 0, self.img_shape[2] - 1))
+            if slice_idx == self.slice_idx:
+                return  # Scrolling past the first or last slice, nothing to redraw
+            self.slice_idx = slice_idx
+            self.slice_slider.setValue(self.slice_idx)  # Update the slider, which schedules the redraw
 
     def update_slice(self, value):
         """Update slice index based on the slice scroller."""
         self.slice_idx = value
         self.frame_slice_label.setText(f"Slice {self.slice_idx}")  # Update slice indicator
-        self.update_image()
+        # Drags emit a value per pixel moved, render at most once per interval with the latest one
+        if not self.slice_timer.isActive():
+            self.slice_timer.start()
 
     def toggle_play(self):
         """Toggle between play and stop for CINE mode."""
         if not self.playing:
             self.playing = True
-            self.timer.start(self.playback_speed)
+            self.start_playback_clock()
         else:
             self.playing = False
             self.timer.stop()
@@ -857,19 +1335,38 @@ class NiftiViewer(QMainWindow):
         self.playing = False
         self.timer.stop()
 
+    def start_playback_clock(self):
+        """Schedule CINE frames every playback_speed ms from now."""
+        self.playback_start = time.perf_counter()
+        self.playback_ticks = 0  # Frames advanced since playback_start
+        self.timer.start(self.playback_speed)
+
     def next_frame(self):
         """Go to the next frame in CINE mode."""
-        if len(self.img_data.shape) == 4 and self.img_data.shape[3] > 1:
-            self.time_idx = (self.time_idx + 1) % self.img_data.shape[3]
+        step = 1
+        if self.playing:
+            # Frames are due on a fixed schedule from the start of playback, so timer latency
+            # doesn't accumulate and a late tick skips the frames it missed instead of queueing them
+            due = int((time.perf_counter() - self.playback_start) * 1000 // self.playback_speed)
+            step = max(1, due - self.playback_ticks)
+            self.playback_ticks += step
+
+        if len(self.img_shape) == 4 and self.img_shape[3] > 1:
+            self.time_idx = (self.time_idx + step) % self.img_shape[3]
             self.frame_slice_label.setText(f"Frame {self.time_idx}")
             self.update_image()
 
+        if self.playing:
+            next_due_ms = (self.playback_ticks + 1) * self.playback_speed
+            elapsed_ms = (time.perf_counter() - self.playback_start) * 1000
+            self.timer.start(max(0, int(next_due_ms - elapsed_ms)))
+
     def adjust_speed(self, value):
         """Adjust the playback speed for CINE mode."""
         self.playback_speed = value
         self.playback_speed_label.setText(f"Playback Speed: {self.playback_speed} ms")
         if self.playing:
-            self.timer.start(self.playback_speed)
+            self.start_playback_clock()
 
     def toggle_dark_mode(self, state):
         """Toggle between dark mode and light mode."""
@@ -881,16 +1378,10 @@ class NiftiViewer(QMainWindow):
 
     def apply_dark_mode(self):
         """Apply dark mode styles."""
-        self.ax.set_facecolor('black')
-        self.figure.patch.set_facecolor('black')
-        self.ax.title.set_color('white')
         self.setStyleSheet("background-color: black; color: white;")
 
     def apply_light_mode(self):
         """Apply light mode styles."""
-        self.ax.set_facecolor('white')
-        self.figure.patch.set_facecolor('white')
-        self.ax.title.set_color('black')
         self.setStyleSheet("background-color: white; color: black;")
 
     def upload_file(self):
@@ -911,20 +1402,20 @@ class NiftiViewer(QMainWindow):
     def load_nifti_file(self, file_path):
         """Load the NIfTI file and update the main image display."""
         try:
-            nii_file = nib.load(file_path)
+            nii_file = self.open_nifti(file_path)
             self.add_thumbnail(file_path)  # Now, let add_thumbnail handle the addition to uploaded_files
 
-            # Load the first file by default if no file is currently active
-            if not self.current_file:
+            # Load the first file by default if no file is currently active (or on its way)
+            if not self.current_file and self._pending_active_path is None:
                 self.set_active_file(file_path)
 
-            # Use SimpleITK to read temporal resolution from the NIfTI header
-            itk_img = sitk.ReadImage(file_path)
-            img_spacing = itk_img.GetSpacing()
-
             # If it's a CINE scan (4D image), set the playback speed to the temporal resolution
-            if len(self.img_data.shape) == 4 and self.img_data.shape[3] > 1:
-                temporal_resolution = img_spacing[3] * 1000  # Convert seconds to milliseconds
+            if len(nii_file.shape) == 4 and nii_file.shape[3] > 1:
+                # The header already holds the frame spacing, in its own time unit
+                frame_spacing = nii_file.header.get_zooms()[3]
+                time_unit = nii_file.header.get_xyzt_units()[1]
+                seconds_per_unit = {'msec': 1e-3, 'usec': 1e-6}.get(time_unit, 1.0)
+                temporal_resolution = frame_spacing * seconds_per_unit * 1000  # Convert seconds to milliseconds
                 self.playback_speed = max(10, int(temporal_resolution))  # Ensure minimum speed
                 self.playback_speed_label.setText(f"Playback Speed: {self.playback_speed} ms")
                 self.speed_slider.setValue(self.playback_speed)
@@ -947,26 +1438,11 @@ class NiftiViewer(QMainWindow):
 
             # Now, add the file to the dictionary of uploaded files after the check
             self.uploaded_files[filename] = file_path
-            nii_file = nib.load(file_path)
-            middle_slice = extract_slice(nii_file)
-
-            # Create thumbnail image
-            fig, ax = plt.subplots(figsize=(1.7, 1.7))
-            ax.imshow(middle_slice, cmap='gray')
-            ax.axis('off')
-            fig.patch.set_facecolor("black")
-            plt.tight_layout()
-
-            # Convert the plot to a canvas and use it as a thumbnail
-            canvas = FigureCanvas(fig)
-            canvas.draw()
-
-            # Convert canvas to QPixmap and then to QIcon
-            thumbnail_pixmap = QPixmap(canvas.grab())
-            thumbnail_icon = QIcon(thumbnail_pixmap)
-
-            # Create a draggable thumbnail button
-            thumbnail_button = DraggableThumbnail(file_path, thumbnail_icon)
+
+            # Create a draggable thumbnail button, blank until its image is rendered in the background
+            placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+            placeholder.fill(Qt.black)
+            thumbnail_button = DraggableThumbnail(file_path, QIcon(placeholder))
             thumbnail_button.clicked.connect(partial(self.select_file_by_thumbnail, file_path))
 
             # Create delete button
@@ -987,9 +1463,23 @@ class NiftiViewer(QMainWindow):
             self.scroll_layout.addWidget(thumbnail_container)
             self.thumbnail_containers[filename] = thumbnail_container
 
+            # Read and render the thumbnail on the thread pool, so dropping many files doesn't block the UI
+            job = ThumbnailJob(file_path)
+            job.signals.thumbnail_ready.connect(self.on_thumbnail_ready)
+            self.thread_pool.start(job)
+
         except Exception as e:
             print(f"Error creating thumbnail for file: {file_path}\n{e}")
 
+    def on_thumbnail_ready(self, file_path, image):
+        """Show a thumbnail rendered by a ThumbnailJob, if its file is still in the sidebar."""
+        container = self.thumbnail_containers.get(os.path.basename(file_path))
+        if container is None:
+            return
+        thumbnail_button = container.findChild(DraggableThumbnail)
+        if thumbnail_button is not None and thumbnail_button.file_path == file_path:
+            thumbnail_button.setIcon(QIcon(QPixmap.fromImage(image)))
+
     def start_drag(self, event, file_path):
         """Initiate drag event for thumbnails."""
         drag = QDrag(self)
@@ -1014,6 +1504,10 @@ class NiftiViewer(QMainWindow):
                 del self.uploaded_files[filename]
             else:
                 pass
+            self._nifti_images.pop(file_path, None)
+            self._decoded_volumes.pop(file_path, None)
+            if self._pending_active_path == file_path:
+                self._pending_active_path = None  # Drop the read still in flight
 
             # Remove the thumbnail container
             if filename in self.thumbnail_containers:
@@ -1027,52 +1521,85 @@ class NiftiViewer(QMainWindow):
                 self.current_file = None
                 self.img_data = None
                 self.img_affine = None
-                self.ax.clear()
-                self.canvas.draw()
+                self.main_image_label.clear()
                 self.setWindowTitle('TARDIS - No File Selected')
 
             # If the deleted file was in comparison, close comparison
-            if self.comparison_widget.isVisible() and self.comparison_widget.image_data is not None:
-                comparison_file = None
-                # Find which file is in comparison by matching image data
-                for fname, fpath in self.uploaded_files.items():
-                    try:
-                        nii = nib.load(fpath)
-                        data = extract_slice(nii)
-                        if np.array_equal(data, self.comparison_widget.image_data):
-                            comparison_file = fpath
-                            break
-                    except:
-                        continue
-                if comparison_file == file_path:
+            if self._pending_comparison_path == file_path:
+                self._pending_comparison_path = None  # Drop the read still in flight
+            if self.comparison_file_path == file_path:
+                self.comparison_file_path = None
+                if self.comparison_widget.isVisible():
                     self.comparison_widget.close_comparison()
 
         except Exception as e:
             print(f"Error deleting file: {e}")
 
     def update_image(self):
-        """Update the main canvas with the current slice or frame."""
-        self.ax.clear()
+        """Update the main image with the current slice or frame."""
         try:
-            if len(self.img_data.shape) == 4 and self.img_data.shape[3] == 1:
-                slice_data = self.img_data[:, :, self.slice_idx, 0]  # 3D image disguised as 4D
-                self.frame_slice_label.setText(f"Slice {self.slice_idx}")
-            elif len(self.img_data.shape) == 4:
-                slice_data = self.img_data[:, :, self.slice_idx, self.time_idx]
-                self.frame_slice_label.setText(f"Frame {self.time_idx}")
-            else:
-                slice_data = self.img_data[:, :, self.slice_idx]
-                self.frame_slice_label.setText(f"Slice {self.slice_idx}")
-
-            self.ax.imshow(slice_data, cmap='gray')
-            self.ax.set_title(self.frame_slice_label.text())
-            self.canvas.draw()
+            if self._draw_frame is None:
+                # Pick the drawing routine once per volume rather than branching on its shape per frame
+                shape = self.img_shape
+                if len(shape) == 4 and shape[3] > 1:
+                    self._draw_frame = self.draw_cine_frame
+                else:
+                    self._slice_index_tail = (0,) if len(shape) == 4 else ()  # 3D image disguised as 4D
+                    self._draw_frame = self.draw_slice
+            self._draw_frame()
         except Exception as e:
             print(f"Error updating image: {e}")
 
+    def draw_slice(self):
+        """Show slice_idx of a 3D volume."""
+        slice_data = self.read_slice((slice(None), slice(None), self.slice_idx) + self._slice_index_tail)
+        self.frame_slice_label.setText(f"Slice {self.slice_idx}")
+
+        if self._main_u8 is None or self._main_u8.shape != slice_data.shape:
+            # New slice geometry: reallocate the buffers and the QImage wrapping them
+            self._main_u8 = np.empty(slice_data.shape, dtype=np.uint8)
+            self._main_f32 = np.empty(slice_data.shape, dtype=np.float32)
+            height, width = slice_data.shape
+            self._main_qimage = QImage(self._main_u8.data, width, height, self._main_u8.strides[0],
+                                       QImage.Format_Grayscale8)
+
+        self.window_to_u8(slice_data, self._main_u8, self._main_f32)
+        self.main_image_label.set_source_pixmap(QPixmap.fromImage(self._main_qimage))
+
+    def draw_cine_frame(self):
+        """Show frame time_idx of slice_idx of a CINE volume."""
+        self.frame_slice_label.setText(f"Frame {self.time_idx}")
+        if self._cine_frames is None or self._cine_slice_idx != self.slice_idx:
+            self.render_cine_frames()
+        # Playback only uploads an already rendered frame
+        self.main_image_label.set_source_pixmap(QPixmap.fromImage(self._cine_frames[self.time_idx]))
+
+    def window_to_u8(self, data, u8_buf, tmp_f32):
+        """Map 2D data into u8_buf by the volume's display range."""
+        if lut_supported(data.dtype):
+            # Integer data read straight from the file: one table lookup per pixel
+            if self._display_lut is None:
+                self._display_lut = build_display_lut(data.dtype, *self.display_range())
+            np.take(self._display_lut, data.view(f'u{data.dtype.itemsize}'), out=u8_buf)
+        else:
+            normalize_to_u8(data, u8_buf, tmp_f32, *self.display_range())
+
+    def render_cine_frames(self):
+        """Render every frame of the current CINE slice to uint8 in one pass."""
+        frames = self.read_slice((slice(None), slice(None), self.slice_idx))
+        frames = np.ascontiguousarray(np.moveaxis(frames, 2, 0))  # (frame, row, column)
+        n_frames, height, width = frames.shape
+        self._cine_u8 = np.empty(frames.shape, dtype=np.uint8)
+        # Stacked frames are windowed as one tall 2D image
+        self.window_to_u8(frames.reshape(-1, width), self._cine_u8.reshape(-1, width),
+                          np.empty((n_frames * height, width), dtype=np.float32))
+        self._cine_frames = [QImage(frame.data, width, height, frame.strides[0], QImage.Format_Grayscale8)
+                             for frame in self._cine_u8]
+        self._cine_slice_idx = self.slice_idx
+
     def switch_mode(self, nii_file):
         """Switch between CINE playback mode and 3D slice scrolling mode."""
-        img_shape = nii_file.get_fdata().shape
+        img_shape = nii_file.shape
 
         # Set visibility based on the type of file (3D or 4D)
         if len(img_shape) == 4 and img_shape[3] > 1:
@@ -1096,70 +1623,17 @@ class NiftiViewer(QMainWindow):
             self.slice_depth_label.setVisible(True)
             self.frame_slice_label.setText(f"Slice {self.slice_idx}")
             self.frame_slice_label.setVisible(True)
+            # The slider is connected once, in add_controls. Its signals are blocked here because
+            # the caller has already drawn this slice, so update_slice would only redraw it again
+            self.slice_slider.blockSignals(True)
             self.slice_slider.setMaximum(img_shape[2] - 1)  # Set max slices based on 3D depth
             self.slice_slider.setValue(self.slice_idx)
-            self.slice_slider.valueChanged.connect(self.update_slice)
+            self.slice_slider.blockSignals(False)
 
         # Explicitly stop playback mode if switching from 4D to 3D
         self.playing = False
         self.timer.stop()
 
-    def update_slice(self, value):
-        """Update slice index based on the slice scroller."""
-        self.slice_idx = value
-        self.frame_slice_label.setText(f"Slice {self.slice_idx}")  # Update slice indicator
-        self.update_image()
-
-    def toggle_play(self):
-        """Toggle between play and stop for CINE mode."""
-        if not self.playing:
-            self.playing = True
-            self.timer.start(self.playback_speed)
-        else:
-            self.playing = False
-            self.timer.stop()
-
-    def stop_playback(self):
-        """Stop CINE playback."""
-        self.playing = False
-        self.timer.stop()
-
-    def next_frame(self):
-        """Go to the next frame in CINE mode."""
-        if len(self.img_data.shape) == 4 and self.img_data.shape[3] > 1:
-            self.time_idx = (self.time_idx + 1) % self.img_data.shape[3]
-            self.frame_slice_label.setText(f"Frame {self.time_idx}")
-            self.update_image()
-
-    def adjust_speed(self, value):
-        """Adjust the playback speed for CINE mode."""
-        self.playback_speed = value
-        self.playback_speed_label.setText(f"Playback Speed: {self.playback_speed} ms")
-        if self.playing:
-            self.timer.start(self.playback_speed)
-
-    def toggle_dark_mode(self, state):
-        """Toggle between dark mode and light mode."""
-        self.dark_mode_enabled = state == Qt.Checked
-        if self.dark_mode_enabled:
-            self.apply_dark_mode()
-        else:
-            self.apply_light_mode()
-
-    def apply_dark_mode(self):
-        """Apply dark mode styles."""
-        self.ax.set_facecolor('black')
-        self.figure.patch.set_facecolor('black')
-        self.ax.title.set_color('white')
-        self.setStyleSheet("background-color: black; color: white;")
-
-    def apply_light_mode(self):
-        """Apply light mode styles."""
-        self.ax.set_facecolor('white')
-        self.figure.patch.set_facecolor('white')
-        self.ax.title.set_color('black')
-        self.setStyleSheet("background-color: white; color: black;")
-
     def add_controls(self):
         # Play/Stop buttons for CINE mode
         button_layout = QHBoxLayout()
@@ -1215,7 +1689,7 @@ class NiftiViewer(QMainWindow):
         """Apply the modification and update history."""
         if new_affine is not None:
             self.img_affine = new_affine  # Update affine matrix if provided
-        self.history.push(self.img_data.copy())
+        self.history.push(self.img_data)  # Modifications return new arrays, so no copy is needed
         self.img_data = modified_data
         self.update_image()
         self.update_undo_redo_actions()
@@ -1259,11 +1733,11 @@ class NiftiViewer(QMainWindow):
             return
 
         try:
-            original_data = self.img_data.copy()
-            # Start a thread to perform resampling
-            thread = ModificationThread(self.resample_algorithm, original_data, factor)
-            thread.modification_complete.connect(self.on_modification_complete)
-            thread.start()
+            original_data = self.img_data_view()
+            # Queue a job on the thread pool to perform resampling
+            job = ModificationJob(self.resample_algorithm, original_data, factor)
+            job.signals.modification_complete.connect(self.on_modification_complete)
+            self.thread_pool.start(job)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to apply resampling:\n{e}")
 
@@ -1273,7 +1747,7 @@ class NiftiViewer(QMainWindow):
             return
 
         try:
-            original_data = self.img_data.copy()
+            original_data = self.img_data_view()
             modified_data = self.normalize_intensity(original_data, min_val, max_val)
             if modified_data is None:
                 raise ValueError("Intensity normalization failed.")
@@ -1289,13 +1763,14 @@ class NiftiViewer(QMainWindow):
             return
 
         try:
-            reference_nii = nib.load(reference_file)
-            reference_data = reference_nii.get_fdata()
+            reference_nii = self.open_nifti(reference_file)
+            reference_data = reference_nii.get_fdata(dtype=np.float32, caching='unchanged')
             reference_affine = reference_nii.affine
 
-            original_data = self.img_data.copy()
+            original_data = self.img_data_view()
             original_affine = self.img_affine.copy()
 
+            from registration_modifications import affine_registration, non_rigid_registration
             if registration_type == "Affine":
                 func = affine_registration
             elif registration_type == "Non-Rigid":
@@ -1304,10 +1779,10 @@ class NiftiViewer(QMainWindow):
                 QMessageBox.warning(self, "Registration Type", "Unknown registration type selected.")
                 return
 
-            # Start a thread to perform registration
-            thread = ModificationThread(func, original_data, original_affine, reference_data, reference_affine)
-            thread.modification_complete.connect(self.on_registration_complete)
-            thread.start()
+            # Queue a job on the thread pool to perform registration
+            job = ModificationJob(func, original_data, original_affine, reference_data, reference_affine)
+            job.signals.modification_complete.connect(self.on_registration_complete)
+            self.thread_pool.start(job)
 
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to apply registration:\n{e}")
@@ -1325,10 +1800,10 @@ class NiftiViewer(QMainWindow):
             return
 
         try:
-            original_data = self.img_data.copy()
-            modified_data = original_data.copy()
+            modified_data = self.img_data_view()
 
             filter_name = selected_filters.get('type')
+            from filtering_modifications import apply_gaussian_filter, apply_median_filter, apply_non_local_means
 
             # Apply each selected filter sequentially
             if filter_name == 'gaussian':
@@ -1364,44 +1839,67 @@ class NiftiViewer(QMainWindow):
             QMessageBox.critical(self, "Resampling Failed", "Resampling encountered an error.")
 
     def normalize_intensity(self, img_data, min_val, max_val):
-        """Intensity normalization."""
+        """Intensity normalization, returned as float32."""
         try:
-            img_min = np.min(img_data)
-            img_max = np.max(img_data)
+            img_min, img_max = volume_range(img_data)
             if img_max - img_min == 0:
                 raise ValueError("Image has zero intensity range.")
-            normalized = (img_data - img_min) / (img_max - img_min)  # Scale to [0,1]
-            normalized = normalized * (max_val - min_val) + min_val  # Scale to [min_val, max_val]
+            # Map [img_min, img_max] to [min_val, max_val] in a single pass without temporaries
+            scale = np.float32((max_val - min_val) / (img_max - img_min))
+            normalized = np.empty_like(img_data, dtype=np.float32)  # Same memory layout as the input
+            if njit is not None:
+                # Elementwise, so both arrays can be walked in memory order without a copy
+                _rescale_kernel(img_data.ravel(order='K'), normalized.ravel(order='K'),
+                                np.float32(img_min), scale, np.float32(min_val))
+            else:
+                # Fold the shift into one offset so the buffer is only walked twice
+                np.multiply(img_data, scale, out=normalized, dtype=np.float32, casting='unsafe')
+                normalized += np.float32(min_val - img_min * scale)
             return normalized
         except Exception as e:
             print(f"Intensity normalization failed: {e}")
             return None  # Indicate failure
 
     def resample_algorithm(self, img_data, factor):
-        """Resampling algorithm using Nibabel."""
+        """Linear resampling, with a Numba kernel or SimpleITK."""
         try:
-            # Create a Nibabel Nifti1Image
-            nifti_img = nib.Nifti1Image(img_data, self.img_affine)
-
-            # Define the resampling factor
-            new_affine = nifti_img.affine.copy()
+            # Define the resampling factor, the first voxel centre stays in place
+            new_affine = self.img_affine.copy()
             new_affine[:3, :3] = new_affine[:3, :3] / factor  # Adjust spacing
 
-            # Compute new shape
-            new_shape = np.ceil(np.array(nifti_img.shape) * factor).astype(int)
-
-            # Perform resampling using Nibabel's processing
-            resampled_img = resample_from_to(nifti_img, target_affine=new_affine, target_shape=new_shape,
-                                             order=1)  # order=1 for linear
-            resampled_data = resampled_img.get_fdata()
-            resampled_affine = resampled_img.affine
-
-            return resampled_data, resampled_affine
+            # Compute new shape (time frames are kept as they are)
+            new_shape = np.ceil(np.array(img_data.shape[:3]) * factor).astype(int)
+            frames = img_data.reshape(img_data.shape[:3] + (-1,))
+
+            if njit is not None:
+                # All frames in one multi-threaded pass, in nibabel's Fortran order (a no-op for loaded volumes)
+                frames = np.asfortranarray(frames)
+                resampled_data = np.empty(tuple(new_shape) + (frames.shape[3],), dtype=np.float32, order='F')
+                tables = [table for n_in, n_out in zip(frames.shape[:3], new_shape)
+                          for table in _linear_zoom_tables(n_in, int(n_out), factor)]
+                _linear_zoom_kernel(frames, resampled_data, *tables)
+                return resampled_data.reshape(tuple(new_shape) + img_data.shape[3:], order='F'), new_affine
+
+            resampled_data = np.empty(tuple(new_shape) + (frames.shape[3],), dtype=np.float32)
+
+            # Resample each 3D frame in voxel space; sitk sees NumPy axes in reverse order
+            import SimpleITK as sitk
+            with _resampler_lock:
+                resampler = get_resampler()
+                resampler.SetSize([int(n) for n in new_shape[::-1]])
+                resampler.SetOutputSpacing([1.0 / factor] * 3)
+                for t in range(frames.shape[3]):
+                    frame = sitk.GetImageFromArray(np.ascontiguousarray(frames[..., t], dtype=np.float32))
+                    # Copy straight out of the ITK buffer instead of via an intermediate array,
+                    # the view does not keep the image alive so hold on to it until then
+                    resampled_frame = resampler.Execute(frame)
+                    resampled_data[..., t] = sitk.GetArrayViewFromImage(resampled_frame)
+
+            return resampled_data.reshape(tuple(new_shape) + img_data.shape[3:]), new_affine
         except Exception as e:
             print(f"Resampling failed: {e}")
             return None, None  # Indicate failure
 
-
 if __name__ == '__main__':
     app = QApplication(sys.argv)
 
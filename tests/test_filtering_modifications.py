@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filtering_modifications import apply_non_local_means
+
+
+def test_non_local_means_keeps_wide_signed_integer_range():
+    # Spans more than 32767, so shifting by the minimum in int16 would wrap
+    rng = np.random.default_rng(0)
+    img_data = rng.integers(-30000, 30001, size=(32, 32, 3)).astype(np.int16)
+    img_data[0, 0, 0] = -30000
+    img_data[-1, -1, -1] = 30000
+
+    # A negligible h leaves every voxel as it was, up to quantization
+    denoised = apply_non_local_means(img_data, h=1e-4)
+
+    assert denoised.dtype == np.float32
+    assert denoised.shape == img_data.shape
+    np.testing.assert_allclose(denoised, img_data, atol=1.0)
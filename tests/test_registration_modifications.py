@@ -0,0 +1,22 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from registration_modifications import _np_to_sitk
+
+
+def test_np_to_sitk_places_voxels_by_the_affine():
+    # Permuted axes with anisotropic zooms, the case a transposed direction gets wrong
+    affine = np.array([[0.0, 0.0, 2.0, 10.0],
+                       [0.0, 3.0, 0.0, 20.0],
+                       [1.5, 0.0, 0.0, 30.0],
+                       [0.0, 0.0, 0.0, 1.0]])
+    image = _np_to_sitk(np.zeros((5, 6, 7)), affine)
+
+    assert image.GetSize() == (7, 6, 5)
+    idx = (1, 2, 3)  # Array index, sitk indexes the same voxel in reverse order
+    point = image.TransformIndexToPhysicalPoint(idx[::-1])
+    np.testing.assert_allclose(point, (affine @ [*idx, 1])[:3])